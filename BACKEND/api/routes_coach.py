@@ -1,7 +1,17 @@
-from http.client import HTTPException
-from fastapi import APIRouter
+from typing import List, Optional
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel
-from src.gpt_client import ask_openai
+from src.gpt_client import ask_openai_shared
+from src.coach_bulk import (
+    BULK_CONCURRENCY,
+    clamp_concurrency,
+    coaching_prompt,
+    get_job,
+    make_batch_id,
+    run_bulk_coaching,
+    unique_prompts,
+)
 import asyncio
 
 router = APIRouter()
@@ -9,18 +19,53 @@ router = APIRouter()
 class CoachRequest(BaseModel):
     prompt: str
 
+class BulkCoachRequest(BaseModel):
+    prompts: List[str]
+    batch_id: Optional[str] = None # reenviar el mismo id (o la misma lista) reanuda el lote
+    concurrency: int = BULK_CONCURRENCY # se limita a 1..COACH_BULK_CONCURRENCY_MAX
+
 @router.post("/coach")
 async def coach(request: CoachRequest) -> dict:
     """
     Devuelve un plan textual basado en la base de conocimiento /kb.
     """
     try:
-        # Ejecuta ask_openai en un hilo separado (no bloquea el event loop)
+        # Ejecuta en un hilo separado (no bloquea el event loop); si el mismo
+        # prompt ya está en curso (otra request o el modo bulk), comparte la llamada
         plan = await asyncio.to_thread(
-            ask_openai, f"Genera un plan de coaching para: {request.prompt}"
+            ask_openai_shared, coaching_prompt(request.prompt)
         )
 
         return {"plan": plan}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar plan: {str(e)}")
+
+@router.post("/coach/bulk")
+async def coach_bulk(request: BulkCoachRequest, background_tasks: BackgroundTasks) -> dict:
+    """
+    Lanza en segundo plano la generación de planes para una lista de prompts.
+    Los duplicados se coalescen y los prompts ya respondidos en el lote se saltan.
+    Si el lote ya está en curso, se devuelve su estado en vez de lanzarlo de nuevo.
+    """
+    prompts = unique_prompts(request.prompts)
+    if not prompts:
+        raise HTTPException(status_code=400, detail="La lista de prompts está vacía")
+
+    batch_id = request.batch_id or make_batch_id(prompts)
+    concurrency = clamp_concurrency(request.concurrency)
+
+    job = get_job(batch_id)
+    if job and job["status"] == "running":
+        return {**job, "attached": True}
+
+    background_tasks.add_task(run_bulk_coaching, prompts, batch_id, concurrency)
+    return {"batch_id": batch_id, "total": len(prompts), "concurrency": concurrency, "attached": False}
+
+@router.get("/coach/bulk/{batch_id}")
+async def coach_bulk_status(batch_id: str) -> dict:
+    """Progreso de un lote de coaching bulk."""
+    job = get_job(batch_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    return job
@@ -1,5 +1,8 @@
+import asyncio
+
 from fastapi import APIRouter, HTTPException
 from src.gpt_client import get_analysis_history, get_analysis_by_id
+from src.storage import archive_old_analyses, storage_report, train_dictionary
 
 router = APIRouter()
 
@@ -46,4 +49,30 @@ async def get_stats():
             "average_tokens_per_analysis": total_tokens / total_analyses if total_analyses > 0 else 0
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
+
+@router.get("/storage/stats")
+async def get_storage_stats():
+    """Tamaño de la base y archivos, ratio de compresión y latencia de lectura"""
+    try:
+        # SQLite bloquea: se ejecuta fuera del event loop
+        return await asyncio.to_thread(storage_report)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas de almacenamiento: {str(e)}")
+
+@router.post("/storage/dictionary")
+async def train_storage_dictionary(sample_size: int = 500):
+    """Entrena el diccionario de compresión con las respuestas recientes"""
+    try:
+        return await asyncio.to_thread(train_dictionary, sample_size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error entrenando el diccionario: {str(e)}")
+
+@router.post("/storage/archive")
+async def archive_analyses(days: int = 90, vacuum: bool = False):
+    """Mueve los análisis con más de `days` días a un archivo comprimido de sólo lectura"""
+    try:
+        # Incluye VACUUM: puede tardar, no debe bloquear el event loop
+        return await asyncio.to_thread(archive_old_analyses, days, vacuum)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error archivando análisis: {str(e)}")
@@ -1,16 +1,29 @@
+from typing import Optional
+
 from fastapi import APIRouter
 from pydantic import BaseModel
 from src.gpt_client import ask_openai
+from src.ml_processor import AccidentInput
+from api.routes_risk_prediction import predict_single
 
 router = APIRouter()
 
 class PredictRequest(BaseModel):
     prompt: str
+    accident: Optional[AccidentInput] = None
+    top_k: int = 3
 
 @router.post("/predict")
 async def predict(request: PredictRequest) -> dict:
     """
-    Devuelve {"score": float, "drivers": [top_features]} o una respuesta del modelo.
+    Devuelve {"score": float | None, "drivers": [top_features], "analysis": respuesta del modelo}.
+    Si se envía 'accident', el score y los drivers vienen del ensamble ML
+    (atribuciones reales); si no, sólo se devuelve el análisis de OpenAI.
     """
+    score, drivers = None, []
+    if request.accident is not None:
+        prediction = await predict_single(request.accident, explain=True, top_k=request.top_k)
+        score, drivers = prediction["risk_score"], prediction["drivers"]
+
     response = ask_openai(request.prompt)
-    return {"score": 0.85, "drivers": [response]}
+    return {"score": score, "drivers": drivers, "analysis": response}
@@ -1,26 +1,34 @@
 # api/routes_risk_prediction.py
 from __future__ import annotations
 
+import asyncio
 import io
 import json
 import unicodedata
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 import joblib
 import pandas as pd
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Response, Request, Query
 
 # Importar nuestros módulos y modelos Pydantic
 from src.ml_processor import (
     AccidentInput,
     BatchInput,
+    GridInput,
     load_models,
     preprocess_data,
     get_prediction,
+    get_prediction_explained,
+    get_top_drivers,
     models_loaded,
     metrics,
+    encode_category,
 )
+from src.risk_grid import date_axis, score_grid
+from src.drift_monitor import monitor
+from src.risk_layers import known_accident_types, render_layer
 
 router = APIRouter(
     prefix="/api/risk",
@@ -113,6 +121,21 @@ def _align_to_expected_columns(X: pd.DataFrame) -> pd.DataFrame:
     return X
 
 
+def _norm_comuna(x: str | None) -> str:
+    """
+    Nombre de comuna como lo espera el modelo (mayúsculas, como _harmonize_df).
+    Si esa forma no existe en el modelo, prueba sin acentos (PEÑALOLÉN -> PENALOLEN).
+    """
+    v = str(x or "").upper().strip()
+    if encode_category("Comuna", [v])[0] < 0:
+        return _strip_accents(v)
+    return v
+
+def _format_driver(d: Dict[str, Any]) -> str:
+    """Texto legible de una atribución, p.ej. 'Comuna: MAIPU (+0.042)'."""
+    return f"{d['feature']}: {d['value']} ({d['contribution']:+.3f})"
+
+
 # =========================
 # Eventos
 # =========================
@@ -121,6 +144,7 @@ def _align_to_expected_columns(X: pd.DataFrame) -> pd.DataFrame:
 async def startup_event():
     """Al iniciar la API, carga los modelos en memoria."""
     load_models(model_path="models/")
+    monitor.load_snapshots()
     print(load_models)
 
 
@@ -143,8 +167,12 @@ async def get_model_status():
 
 # Predicción individual
 @router.post("/predict", response_model=Dict[str, Any])
-async def predict_single(data: AccidentInput):
-    """Predice el riesgo para un único accidente."""
+async def predict_single(data: AccidentInput, explain: bool = False, top_k: int = 3):
+    """
+    Predice el riesgo para un único accidente.
+    Con explain=true, 'drivers' son las top_k variables que más aportan
+    al score (ver get_prediction_explained) y se agrega 'attributions'.
+    """
     try:
         # 1) Pydantic → DataFrame
         input_df = pd.DataFrame([data.model_dump()])
@@ -158,13 +186,19 @@ async def predict_single(data: AccidentInput):
         # 2.5) Alinear columnas a las del entrenamiento (si existe feature_columns)
         processed_df = _align_to_expected_columns(processed_df)
 
-        # 3) Predecir
-        score = float(get_prediction(processed_df)[0])
+        # 3) Predecir (con atribuciones si se piden)
+        if explain:
+            scores, base, contribs = get_prediction_explained(processed_df)
+            attributions = get_top_drivers(input_df, contribs, top_k)[0]
+        else:
+            scores = get_prediction(processed_df)
+        score = float(scores[0])
+        monitor.observe(input_df, scores)
 
         # 4) Formatear respuesta
         risk_level = "ALTO" if score > 0.5 else ("MEDIO" if score > 0.25 else "BAJO")
 
-        return {
+        result = {
             "risk_score": score,
             "risk_level": risk_level,
             "drivers": [
@@ -174,6 +208,11 @@ async def predict_single(data: AccidentInput):
             ],
             "timestamp": pd.Timestamp.now().isoformat(),
         }
+        if explain:
+            result["drivers"] = [_format_driver(d) for d in attributions]
+            result["attributions"] = attributions
+            result["base_score"] = float(base)
+        return result
     except HTTPException:
         raise
     except Exception as e:
@@ -182,8 +221,11 @@ async def predict_single(data: AccidentInput):
 
 # Predicción en batch
 @router.post("/predict/batch", response_model=List[Dict[str, Any]])
-async def predict_batch(data: BatchInput):
-    """Predice el riesgo para una lista (batch) de accidentes."""
+async def predict_batch(data: BatchInput, explain: bool = False, top_k: int = 3):
+    """
+    Predice el riesgo para una lista (batch) de accidentes.
+    Con explain=true agrega 'drivers' y 'attributions' a cada resultado.
+    """
     try:
         # 1) Pydantic → DataFrame
         input_list = [item.model_dump() for item in data.accidents]
@@ -198,8 +240,13 @@ async def predict_batch(data: BatchInput):
         # 2.5) Alinear columnas
         processed_df = _align_to_expected_columns(processed_df)
 
-        # 3) Predecir
-        scores = get_prediction(processed_df)
+        # 3) Predecir (con atribuciones si se piden)
+        if explain:
+            scores, base, contribs = get_prediction_explained(processed_df)
+            attributions = get_top_drivers(input_df, contribs, top_k)
+        else:
+            scores = get_prediction(processed_df)
+        monitor.observe(input_df, scores)
 
         # 4) Formatear respuesta
         results = []
@@ -213,6 +260,9 @@ async def predict_batch(data: BatchInput):
                     "input_data": input_list[i],
                 }
             )
+            if explain:
+                results[-1]["drivers"] = [_format_driver(d) for d in attributions[i]]
+                results[-1]["attributions"] = attributions[i]
         return results
     except HTTPException:
         raise
@@ -249,6 +299,7 @@ async def predict_csv(file: UploadFile = File(...)):
 
         # 3) Predecir
         scores = get_prediction(processed_df)
+        monitor.observe(input_df, scores)
 
         # 4) Devolver resultados
         out_df = input_df.copy()
@@ -264,6 +315,127 @@ async def predict_csv(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail=f"Error procesando el CSV: {e}")
 
 
+# Barrido de escenarios (what-if / pronóstico)
+@router.post("/grid")
+async def predict_grid(data: GridInput, format: str = "json"):
+    """
+    Predice el riesgo para todo el producto comunas x tipos x días en una
+    sola pasada vectorizada. Devuelve un cubo [comuna][tipo][día]:
+    - format=json: columnar (ejes + matriz anidada de scores)
+    - format=binary: float32 little-endian en orden C, con los ejes en headers
+    """
+    if format not in {"json", "binary"}:
+        raise HTTPException(status_code=400, detail="Formato inválido. Use 'json' o 'binary'")
+
+    try:
+        # 1) Armonización (mismas reglas que _harmonize_df)
+        region = _norm_region(data.region)
+        comunas = [str(c).upper().strip() for c in data.comunas]
+        tipos = list(data.tipos_accidente)
+        clases = [_norm_accident_label(t) for t in tipos]
+        fechas = date_axis(data.fecha_inicio, data.fecha_fin)
+
+        if not comunas or not tipos:
+            raise ValueError("Se requiere al menos una comuna y un tipo de accidente")
+
+        # 2) Predecir la grilla completa
+        cube = score_grid(region, comunas, tipos, clases, fechas, leves=data.leves)
+
+        # 3) Formatear respuesta
+        if format == "binary":
+            return Response(
+                content=cube.astype("<f4").tobytes(order="C"),
+                media_type="application/octet-stream",
+                headers={
+                    "X-Grid-Shape": ",".join(str(n) for n in cube.shape),
+                    "X-Grid-Dtype": "float32",
+                    "X-Grid-Comunas": json.dumps(comunas),
+                    "X-Grid-Tipos": json.dumps(tipos),
+                    "X-Grid-Fechas": f"{fechas[0].date().isoformat()}/{fechas[-1].date().isoformat()}",
+                },
+            )
+
+        unknown = [c for c, i in zip(comunas, encode_category("Comuna", comunas)) if i < 0]
+        return {
+            "shape": list(cube.shape),
+            "comunas": comunas,
+            "tipos_accidente": tipos,
+            "fechas": [d.date().isoformat() for d in fechas],
+            "comunas_desconocidas": unknown,
+            "risk_score": cube.round(4).tolist(),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error en la predicción de la grilla: {e}")
+
+
+# Capa de riesgo por comuna para el mapa
+@router.get("/layers/comunas")
+async def get_comuna_layer(
+    request: Request,
+    period: Optional[str] = None,
+    zoom: int = 10,
+    format: str = "geojson",
+    region: str = "METROPOLITANA",
+    tipos_accidente: Optional[List[str]] = Query(None),
+):
+    """
+    Riesgo medio por comuna en un periodo mensual ("YYYY-MM", por defecto el
+    actual), promediado sobre los tipos de accidente (por defecto todos los
+    que conoce el modelo).
+    - format=geojson: geometrías simplificadas para el zoom pedido + risk_score
+    - format=scores: sólo {comuna: risk_score}, sin geometrías
+
+    Las capas se calculan una vez y quedan en caché; soporta ETag / If-None-Match.
+    """
+    if format not in {"geojson", "scores"}:
+        raise HTTPException(status_code=400, detail="Formato inválido. Use 'geojson' o 'scores'")
+
+    try:
+        period = period or pd.Timestamp.now().strftime("%Y-%m")
+        tipos = tipos_accidente or known_accident_types()
+        body, etag = render_layer(
+            period,
+            zoom,
+            format,
+            region,
+            tipos,
+            [_norm_accident_label(t) for t in tipos],
+            _norm_comuna,
+            _norm_region,
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error generando la capa: {e}")
+
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=3600"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    media_type = "application/geo+json" if format == "geojson" else "application/json"
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+# Monitor de drift
+@router.get("/drift")
+async def get_drift_report():
+    """
+    Compara las entradas y scores de producción (desde la última referencia)
+    contra la referencia: PSI por variable, PSI/KS de risk_score y tasa de
+    categorías desconocidas por el modelo.
+    """
+    # Espera a que el hilo del monitor agregue lo pendiente: fuera del event loop
+    return await asyncio.to_thread(monitor.report)
+
+
+@router.post("/drift/reference")
+async def set_drift_reference():
+    """Fija la ventana actual como referencia de drift y comienza una nueva."""
+    return await asyncio.to_thread(monitor.set_reference)
+
+
 # Ranking de Comunas
 @router.get("/comunas/ranking")
 async def get_comuna_ranking(limit: int = 5):
@@ -31,6 +31,14 @@ app.add_middleware(
     allow_credentials=True,          # Permitir cookies/autenticación
     allow_methods=["*"],             # Permitir todos los métodos (GET, POST, etc.)
     allow_headers=["*"],             # Permitir todos los headers (Authorization, Content-Type, etc.)
+    expose_headers=[                 # Headers legibles desde el navegador (grilla binaria, caché de capas)
+        "X-Grid-Shape",
+        "X-Grid-Dtype",
+        "X-Grid-Comunas",
+        "X-Grid-Tipos",
+        "X-Grid-Fechas",
+        "ETag",
+    ],
 )
 
 # Evento de startup para inicializar la base de datos
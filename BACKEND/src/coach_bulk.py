@@ -0,0 +1,200 @@
+# src/coach_bulk.py
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .database import db_connection
+from .gpt_client import ask_openai_shared
+
+# -------------------------------------------------------------------
+# Parámetros (configurables por entorno)
+# -------------------------------------------------------------------
+BULK_CONCURRENCY_MAX = int(os.getenv("COACH_BULK_CONCURRENCY_MAX", "16"))
+BULK_CONCURRENCY = min(int(os.getenv("COACH_BULK_CONCURRENCY", "4")), BULK_CONCURRENCY_MAX)
+BULK_RPM = float(os.getenv("COACH_BULK_RPM", "60")) # peticiones por minuto hacia OpenAI
+BACKOFF_BASE = float(os.getenv("COACH_BULK_BACKOFF", "1")) # segundos; se duplica en cada reintento
+MAX_RETRIES = 5
+
+# Estado en memoria de los lotes lanzados en este proceso
+jobs: Dict[str, Dict[str, Any]] = {}
+_jobs_lock = threading.Lock()
+
+
+def coaching_prompt(prompt: str) -> str:
+    """Prompt enviado a OpenAI para un plan de coaching (mismo que /coach)."""
+    return f"Genera un plan de coaching para: {prompt}"
+
+
+def make_batch_id(prompts: List[str]) -> str:
+    """
+    Id determinista del lote: reenviar la misma lista reanuda el mismo lote.
+    """
+    return hashlib.sha1("\n".join(prompts).encode("utf-8")).hexdigest()[:16]
+
+
+def unique_prompts(prompts: List[str]) -> List[str]:
+    """Elimina duplicados (ignorando espacios extremos) conservando el orden."""
+    return list(dict.fromkeys(p.strip() for p in prompts if p and p.strip()))
+
+
+def clamp_concurrency(concurrency: int) -> int:
+    """Limita la concurrencia pedida al rango 1..BULK_CONCURRENCY_MAX."""
+    return min(max(1, int(concurrency)), BULK_CONCURRENCY_MAX)
+
+
+class _Pacer:
+    """
+    Espaciado global entre llamadas (BULK_RPM), compartido por los workers
+    de todos los lotes en curso (ver _pacer). Ante un RateLimit, backoff()
+    retrasa a todos los workers, no sólo al que falló.
+    """
+
+    def __init__(self, rpm: float) -> None:
+        self._interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at)
+            self._next_at = start_at + self._interval
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def backoff(self, seconds: float) -> None:
+        with self._lock:
+            self._next_at = max(self._next_at, time.monotonic() + seconds)
+
+
+# Una sola instancia por proceso: dos lotes simultáneos no duplican el ritmo
+_pacer = _Pacer(BULK_RPM)
+
+
+def _completed_prompts(batch_id: str) -> set:
+    """
+    Prompts del lote que ya tienen respuesta guardada (checkpoint). Se leen
+    de coach_batch_items, que no se archiva: sirve aunque la fila ya esté
+    en un archivo histórico.
+    """
+    with db_connection() as conn:
+        cursor = conn.execute(
+            "SELECT prompt FROM coach_batch_items WHERE batch_id = ?",
+            (batch_id,),
+        )
+        return {row["prompt"] for row in cursor.fetchall()}
+
+
+def _checkpoint(analysis_id: int, batch_id: str, prompt: str) -> None:
+    """
+    Registra la respuesta como parte del lote. Si vino de una llamada
+    compartida (con /coach u otro lote), la misma fila queda en ambos;
+    accident_analysis.batch_id conserva sólo el lote que la originó.
+    """
+    with db_connection() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO coach_batch_items (batch_id, prompt, analysis_id) VALUES (?, ?, ?)",
+            (batch_id, prompt, analysis_id),
+        )
+        conn.execute(
+            "UPDATE accident_analysis SET batch_id = ? WHERE id = ? AND batch_id IS NULL",
+            (batch_id, analysis_id),
+        )
+
+
+def _update_job(batch_id: str, **changes: Any) -> None:
+    with _jobs_lock:
+        job = jobs[batch_id]
+        for key, delta in changes.items():
+            job[key] = job[key] + delta if isinstance(delta, int) else delta
+
+
+def _run_one(batch_id: str, prompt: str, pacer: _Pacer) -> None:
+    try:
+        for attempt in range(MAX_RETRIES):
+            pacer.wait()
+            result = ask_openai_shared(coaching_prompt(prompt))
+
+            if not result.get("error"):
+                _checkpoint(result["analysis_id"], batch_id, prompt)
+                _update_job(batch_id, done=1)
+                return
+
+            if not result.get("rate_limited"):
+                break
+            pacer.backoff(BACKOFF_BASE * 2 ** attempt)
+
+        _update_job(batch_id, failed=1, last_error=result.get("message"))
+    except Exception as e:
+        _update_job(batch_id, failed=1, last_error=f"{type(e).__name__} - {e}")
+
+
+def run_bulk_coaching(
+    prompts: List[str],
+    batch_id: Optional[str] = None,
+    concurrency: int = BULK_CONCURRENCY,
+) -> Dict[str, Any]:
+    """
+    Genera planes de coaching para una lista de prompts:
+    - coalesce prompts duplicados,
+    - salta los que ya tienen respuesta en accident_analysis (reanudación),
+    - ejecuta con concurrencia acotada (1..BULK_CONCURRENCY_MAX) y espaciado
+      por BULK_RPM, reintentando con backoff ante RateLimit.
+
+    Bloquea hasta terminar; usar como tarea en segundo plano.
+    Devuelve el estado final del lote. Si el mismo batch_id ya está en
+    curso en este proceso, no lanza otro: devuelve el estado del que corre.
+    """
+    prompts = unique_prompts(prompts)
+    batch_id = batch_id or make_batch_id(prompts)
+
+    with _jobs_lock:
+        running = jobs.get(batch_id)
+        if running and running["status"] == "running":
+            return dict(running)
+        jobs[batch_id] = {
+            "batch_id": batch_id,
+            "status": "running",
+            "total": len(prompts),
+            "done": 0,
+            "skipped": 0,
+            "failed": 0,
+            "last_error": None,
+        }
+
+    try:
+        completed = _completed_prompts(batch_id)
+    except Exception as e:
+        _update_job(batch_id, status="finished", failed=len(prompts), last_error=f"{type(e).__name__} - {e}")
+        return get_job(batch_id)
+    pending = [p for p in prompts if p not in completed]
+    skipped = len(prompts) - len(pending)
+    _update_job(batch_id, done=skipped, skipped=skipped)
+
+    with ThreadPoolExecutor(max_workers=clamp_concurrency(concurrency)) as executor:
+        for prompt in pending:
+            executor.submit(_run_one, batch_id, prompt, _pacer)
+
+    _update_job(batch_id, status="finished")
+    return get_job(batch_id)
+
+
+def get_job(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Estado de un lote (en memoria) o, si no está, lo que hay en la base."""
+    with _jobs_lock:
+        if batch_id in jobs:
+            return dict(jobs[batch_id])
+
+    with db_connection() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) AS done FROM coach_batch_items WHERE batch_id = ?",
+            (batch_id,),
+        ).fetchone()
+    if not row["done"]:
+        return None
+    return {"batch_id": batch_id, "status": "unknown", "done": row["done"]}
@@ -26,7 +26,58 @@ def init_db():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
+
+        # Lote de coaching bulk que generó la fila (checkpoint para reanudar)
+        columns = [row["name"] for row in conn.execute("PRAGMA table_info(accident_analysis)")]
+        if "batch_id" not in columns:
+            conn.execute("ALTER TABLE accident_analysis ADD COLUMN batch_id TEXT")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_accident_analysis_batch ON accident_analysis (batch_id)"
+        )
+
+        # Pertenencia de respuestas a lotes bulk: una misma fila puede servir a
+        # varios lotes (llamada compartida con /coach u otro lote en curso)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS coach_batch_items (
+                batch_id TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                analysis_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (batch_id, prompt)
+            )
+        ''')
+
+        # Diccionarios compartidos para comprimir textos (ver storage.py)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS compression_dicts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Archivos históricos de accident_analysis (sólo lectura)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_archives (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                min_id INTEGER NOT NULL,
+                max_id INTEGER NOT NULL,
+                rows INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Snapshots del monitor de drift (sólo resúmenes, nunca filas)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS drift_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                is_reference INTEGER NOT NULL DEFAULT 0,
+                payload TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
         conn.commit()
         print("Base de datos SQLite inicializada correctamente")
     except Exception as e:
@@ -0,0 +1,286 @@
+# src/drift_monitor.py
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from . import ml_processor
+from .database import db_connection
+
+# --- Parámetros del monitor ---
+SCORE_BINS = 50 # histograma fijo de risk_score en [0, 1]
+MAX_CATEGORIES = 500 # tope de categorías distintas por columna (memoria acotada)
+OTHER_KEY = "__otros__" # categorías que exceden el tope
+SNAPSHOT_INTERVAL = 300 # segundos entre snapshots a SQLite
+QUEUE_SIZE = 1000 # lotes pendientes de agregar; si se llena, se descartan
+WINDOW_SECONDS = int(os.getenv("DRIFT_WINDOW_SECONDS", str(24 * 3600))) # duración de la ventana actual
+SNAPSHOT_RETENTION_DAYS = int(os.getenv("DRIFT_SNAPSHOT_RETENTION_DAYS", "30")) # las referencias no se borran
+EPS = 1e-4 # suavizado para PSI con bins vacíos
+
+
+def _empty_state() -> Dict[str, Any]:
+    return {
+        "started_at": time.time(),
+        "n": 0,
+        "categories": {}, # columna -> {valor: conteo}
+        "unknown": {}, # columna -> filas cuyo dummy no existe en el modelo
+        "score_hist": [0] * SCORE_BINS,
+    }
+
+
+def _psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Population Stability Index entre dos vectores de conteos."""
+    e = expected / max(expected.sum(), 1) + EPS
+    a = actual / max(actual.sum(), 1) + EPS
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def _ks(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Estadístico KS aproximado a partir de dos histogramas con los mismos bins."""
+    e = np.cumsum(expected) / max(expected.sum(), 1)
+    a = np.cumsum(actual) / max(actual.sum(), 1)
+    return float(np.max(np.abs(a - e)))
+
+
+class DriftMonitor:
+    """
+    Monitor en línea de las entradas y scores de producción.
+
+    Sólo guarda resúmenes de tamaño acotado (conteos por categoría, tasa de
+    categorías desconocidas e histograma de risk_score), nunca filas. El
+    estado se guarda periódicamente en la tabla 'drift_snapshots' y se
+    compara contra el snapshot marcado como referencia (PSI / KS).
+
+    La ventana actual rota cada WINDOW_SECONDS: al cerrarse se guarda un
+    último snapshot y se empieza una ventana vacía, así el reporte refleja
+    el tráfico reciente y no todo el histórico desde el arranque.
+
+    observe() sólo encola el lote; la agregación y los snapshots corren en
+    un hilo de fondo para no sumar latencia a la predicción.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._state = _empty_state()
+        self._reference: Optional[Dict[str, Any]] = None
+        self._last_snapshot = time.monotonic()
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=QUEUE_SIZE)
+        self._worker: Optional[threading.Thread] = None
+        self._dropped = 0
+
+    def observe(self, data: pd.DataFrame, scores) -> None:
+        """
+        Registra un lote de predicciones. 'data' es el DataFrame de entrada
+        armonizado (antes de preprocess_data) y no debe modificarse después.
+        Nunca lanza excepciones: el monitoreo no debe romper una predicción.
+        """
+        try:
+            self._ensure_worker()
+            self._queue.put_nowait((data, scores))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+        except Exception as e:
+            print(f"Error en el monitor de drift: {e}")
+
+    def flush(self) -> None:
+        """Espera a que se agreguen todos los lotes encolados."""
+        self._queue.join()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="drift-monitor", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            data, scores = self._queue.get()
+            try:
+                self._aggregate(data, scores)
+            finally:
+                self._queue.task_done()
+
+    def _aggregate(self, data: pd.DataFrame, scores) -> None:
+        try:
+            raw = ml_processor.engineer_features(data)
+            cat_cols = ml_processor.model_artifacts.get('cat_cols', [])
+            tracked = ml_processor.group_cols
+            hist, _ = np.histogram(np.clip(np.asarray(scores, dtype=float), 0, 1), bins=SCORE_BINS, range=(0, 1))
+
+            # Conteos del lote (vectorizados) antes de tomar el lock
+            batch_counts = {
+                col: raw[col].fillna("desconocido").astype(str).value_counts().to_dict()
+                for col in tracked
+                if col in raw.columns
+            }
+
+            with self._lock:
+                closed = self._rotate_if_expired()
+                state = self._state
+                state["n"] += len(raw)
+                state["score_hist"] = [a + int(b) for a, b in zip(state["score_hist"], hist)]
+                for col, counts in batch_counts.items():
+                    known = state["categories"].setdefault(col, {})
+                    for value, n in counts.items():
+                        if col in cat_cols and f"{col}_{value}" not in ml_processor.feature_index:
+                            state["unknown"][col] = state["unknown"].get(col, 0) + int(n)
+                        if value not in known and len(known) >= MAX_CATEGORIES:
+                            value = OTHER_KEY
+                        known[value] = known.get(value, 0) + int(n)
+
+                due = time.monotonic() - self._last_snapshot >= SNAPSHOT_INTERVAL
+                if due:
+                    self._last_snapshot = time.monotonic()
+                    payload = json.dumps(state)
+
+            if closed:
+                self._save(closed, False)
+            if due:
+                self._save(payload, False)
+        except Exception as e:
+            print(f"Error en el monitor de drift: {e}")
+
+    def _rotate_if_expired(self) -> Optional[str]:
+        """
+        Cierra la ventana actual si ya superó WINDOW_SECONDS. Llamar con el
+        lock tomado; devuelve el payload de la ventana cerrada (o None).
+        """
+        if time.time() - self._state.get("started_at", 0) < WINDOW_SECONDS:
+            return None
+        closed = json.dumps(self._state) if self._state["n"] else None
+        self._state = _empty_state()
+        return closed
+
+    # ---------------- Persistencia ----------------
+
+    def _save(self, payload: str, is_reference: bool) -> None:
+        try:
+            with db_connection() as conn:
+                conn.execute(
+                    "INSERT INTO drift_snapshots (is_reference, payload) VALUES (?, ?)",
+                    (int(is_reference), payload),
+                )
+                # Retención: las referencias se conservan siempre
+                conn.execute(
+                    """
+                    DELETE FROM drift_snapshots
+                    WHERE is_reference = 0 AND created_at < datetime('now', ?)
+                    """,
+                    (f"-{SNAPSHOT_RETENTION_DAYS} days",),
+                )
+        except Exception as e:
+            print(f"Error guardando snapshot de drift: {e}")
+
+    def load_snapshots(self) -> None:
+        """
+        Carga desde SQLite la última referencia y, si su ventana aún no
+        expiró, el último snapshot de la ventana actual (p.ej. tras reiniciar).
+        Sólo cuentan los snapshots posteriores a la referencia: los anteriores
+        son datos que ya forman parte de ella.
+        """
+        try:
+            with db_connection() as conn:
+                reference = conn.execute(
+                    """
+                    SELECT id, payload FROM drift_snapshots
+                    WHERE is_reference = 1
+                    ORDER BY id DESC LIMIT 1
+                    """
+                ).fetchone()
+                current = conn.execute(
+                    """
+                    SELECT payload FROM drift_snapshots
+                    WHERE is_reference = 0 AND id > ?
+                    ORDER BY id DESC LIMIT 1
+                    """,
+                    (reference["id"] if reference else 0,),
+                ).fetchone()
+            with self._lock:
+                if reference:
+                    self._reference = json.loads(reference["payload"])
+                if current:
+                    state = json.loads(current["payload"])
+                    if time.time() - state.get("started_at", 0) < WINDOW_SECONDS:
+                        self._state = state
+        except Exception as e:
+            print(f"Error cargando los snapshots de drift: {e}")
+
+    def set_reference(self) -> Dict[str, Any]:
+        """
+        Congela el estado actual como referencia (se guarda en SQLite)
+        y reinicia la ventana actual.
+        """
+        self.flush()
+        with self._lock:
+            self._reference = self._state
+            self._state = _empty_state()
+            payload = json.dumps(self._reference)
+        self._save(payload, True)
+        return {"reference_rows": self._reference["n"]}
+
+    # ---------------- Reporte ----------------
+
+    def report(self) -> Dict[str, Any]:
+        """PSI por columna y PSI/KS de risk_score: ventana actual vs referencia."""
+        self.flush()
+        with self._lock:
+            closed = self._rotate_if_expired()
+            current = json.loads(json.dumps(self._state))
+            dropped = self._dropped
+        if closed:
+            self._save(closed, False)
+        reference = self._reference
+
+        result: Dict[str, Any] = {
+            "window_started_at": current["started_at"],
+            "window_seconds": WINDOW_SECONDS,
+            "rows": current["n"],
+            "reference_rows": reference["n"] if reference else None,
+            "dropped_batches": dropped,
+            "unknown_rate": {
+                col: n / current["n"] for col, n in current["unknown"].items()
+            } if current["n"] else {},
+            "features": {},
+            "risk_score": {},
+        }
+
+        cur_hist = np.array(current["score_hist"], dtype=float)
+        if current["n"]:
+            centers = (np.arange(SCORE_BINS) + 0.5) / SCORE_BINS
+            cdf = np.cumsum(cur_hist) / cur_hist.sum()
+            result["risk_score"]["quantiles"] = {
+                str(q): float(centers[np.searchsorted(cdf, q)]) for q in (0.5, 0.9, 0.99)
+            }
+
+        if not reference or not reference["n"] or not current["n"]:
+            return result
+
+        ref_hist = np.array(reference["score_hist"], dtype=float)
+        result["risk_score"]["psi"] = _psi(ref_hist, cur_hist)
+        result["risk_score"]["ks"] = _ks(ref_hist, cur_hist)
+
+        for col, cur_counts in current["categories"].items():
+            ref_counts = reference["categories"].get(col, {})
+            keys = sorted(set(ref_counts) | set(cur_counts))
+            result["features"][col] = {
+                "psi": _psi(
+                    np.array([ref_counts.get(k, 0) for k in keys], dtype=float),
+                    np.array([cur_counts.get(k, 0) for k in keys], dtype=float),
+                ),
+                "new_categories": [k for k in keys if k not in ref_counts][:20],
+            }
+        return result
+
+
+# Instancia única usada por todas las rutas de predicción
+monitor = DriftMonitor()
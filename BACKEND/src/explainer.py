@@ -0,0 +1,123 @@
+# src/explainer.py
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+
+def build_group_matrix(feature_cols: List[str], group_cols: List[str]) -> np.ndarray:
+    """
+    Matriz (n_features x n_grupos) que suma las columnas dummy de vuelta a su
+    variable original (p.ej. todas las "Comuna_*" -> "Comuna").
+    Las numéricas se mapean a sí mismas.
+    """
+    G = np.zeros((len(feature_cols), len(group_cols)))
+    for i, col in enumerate(feature_cols):
+        for j, group in enumerate(group_cols):
+            if col == group or col.startswith(f"{group}_"):
+                G[i, j] = 1.0
+                break
+    return G
+
+
+def build_tree_paths(model_rf, group_matrix: np.ndarray) -> Dict[str, Any]:
+    """
+    Precalcula, para cada hoja del bosque, la atribución por camino
+    (Saabas): cada split aporta a su feature la diferencia entre la
+    probabilidad del nodo hijo y la del padre. Los aportes se suman ya
+    agrupados por variable original (ver build_group_matrix), así explicar
+    un lote es sólo buscar la hoja de cada árbol.
+
+    Todo se calcula con los arreglos children_left / children_right /
+    feature de los árboles, un nivel de profundidad por iteración para
+    todos los árboles a la vez, sin recorrer nodo a nodo en Python.
+
+    Devuelve:
+        {
+            "leaf_contrib": (n_hojas x n_grupos) aporte acumulado de cada hoja,
+            "leaf_row": fila en leaf_contrib de cada nodo (-1 si no es hoja),
+            "node_value": prob. de clase positiva de cada nodo (todos los árboles),
+            "offsets": posición del primer nodo de cada árbol,
+            "base": promedio de la prob. en la raíz (valor esperado del bosque),
+        }
+    """
+    n_groups = group_matrix.shape[1]
+    group_of_feature = np.where(group_matrix.any(axis=1), group_matrix.argmax(axis=1), -1)
+
+    # Todos los árboles como un solo arreglo de nodos (ids desplazados por árbol)
+    node_values, lefts, rights, groups, offsets = [], [], [], [], []
+    offset = 0
+    for estimator in model_rf.estimators_:
+        tree = estimator.tree_
+        counts = tree.value[:, 0, :]
+        is_split = tree.children_left != tree.children_right
+        node_values.append(counts[:, 1] / counts.sum(axis=1))
+        lefts.append(np.where(is_split, tree.children_left + offset, -1))
+        rights.append(np.where(is_split, tree.children_right + offset, -1))
+        groups.append(np.where(is_split, group_of_feature[tree.feature], -1))
+        offsets.append(offset)
+        offset += tree.node_count
+
+    p = np.concatenate(node_values)
+    left = np.concatenate(lefts)
+    right = np.concatenate(rights)
+    split_group = np.concatenate(groups)
+
+    # De arriba hacia abajo, un nivel por iteración: cada hijo hereda el
+    # aporte acumulado del padre más (p_hijo - p_padre) en la variable del split
+    cum = np.zeros((offset, n_groups))
+    frontier = np.array(offsets, dtype=np.int64)
+    while len(frontier):
+        frontier = frontier[left[frontier] >= 0]
+        for child in (left[frontier], right[frontier]):
+            cum[child] = cum[frontier]
+            known = split_group[frontier] >= 0
+            cum[child[known], split_group[frontier][known]] += p[child[known]] - p[frontier[known]]
+        frontier = np.concatenate([left[frontier], right[frontier]])
+
+    leaf_ids = np.flatnonzero(left < 0)
+    leaf_row = np.full(offset, -1, dtype=np.int64)
+    leaf_row[leaf_ids] = np.arange(len(leaf_ids))
+
+    offsets = np.array(offsets)
+    return {
+        "leaf_contrib": cum[leaf_ids],
+        "leaf_row": leaf_row,
+        "node_value": p,
+        "offsets": offsets,
+        "base": float(np.mean(p[offsets])),
+    }
+
+
+def top_drivers(
+    contribs: np.ndarray,
+    group_cols: List[str],
+    raw_values: pd.DataFrame,
+    top_k: int = 3,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Para cada fila, las top_k variables con mayor aporte absoluto al score,
+    con el valor de entrada correspondiente.
+    """
+    k = max(0, min(top_k, len(group_cols)))
+    order = np.argsort(-np.abs(contribs), axis=1)[:, :k]
+    top = np.take_along_axis(contribs, order, axis=1).tolist()
+
+    # Columnas como listas nativas: evita construir una Serie por fila
+    columns = [
+        raw_values[g].tolist() if g in raw_values.columns else [None] * len(raw_values)
+        for g in group_cols
+    ]
+    return [
+        [
+            {
+                "feature": group_cols[j],
+                "value": columns[j][i],
+                "contribution": c,
+            }
+            for j, c in zip(idx, top[i])
+        ]
+        for i, idx in enumerate(order.tolist())
+    ]
@@ -2,6 +2,8 @@
 from __future__ import annotations
 
 import os
+import threading
+from concurrent.futures import Future
 from pathlib import Path
 from typing import Any, Dict, Optional
 
@@ -11,6 +13,7 @@ from openai import AuthenticationError, APIConnectionError, RateLimitError, BadR
 
 # Base de datos local
 from .database import db_connection, init_db
+from .storage import decode_row, encode_text, get_archived_analysis
 
 
 # -------------------------------------------------------------------
@@ -92,11 +95,12 @@ def ask_openai(
                 (user_prompt, openai_response, tokens_used, model_used)
                 VALUES (?, ?, ?, ?)
                 """,
-                (prompt, result, getattr(usage, "total_tokens", None), selected_model),
+                (encode_text(prompt), encode_text(result), getattr(usage, "total_tokens", None), selected_model),
             )
-            _ = cursor.lastrowid  # Si se quiere retornar más adelante
+            analysis_id = cursor.lastrowid
 
         return {
+            "analysis_id": analysis_id,
             "message": result,
             "tokens": {
                 "prompt": getattr(usage, "prompt_tokens", None),
@@ -117,7 +121,11 @@ def ask_openai(
         }
 
     except RateLimitError:
-        return {"error": True, "message": "Límite de peticiones alcanzado. Intenta de nuevo en unos segundos."}
+        return {
+            "error": True,
+            "rate_limited": True,
+            "message": "Límite de peticiones alcanzado. Intenta de nuevo en unos segundos.",
+        }
 
     except APIConnectionError:
         return {"error": True, "message": "No se pudo conectar con OpenAI. Revisa tu conexión a Internet."}
@@ -129,6 +137,47 @@ def ask_openai(
         return {"error": True, "message": f"Error inesperado: {type(e).__name__} - {e}"}
 
 
+# -------------------------------------------------------------------
+# Single-flight: prompts idénticos en curso comparten una sola llamada
+# -------------------------------------------------------------------
+_inflight: Dict[tuple, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def ask_openai_shared(
+    prompt: str,
+    model: Optional[str] = None,
+    temperature: float = 0.7,
+    max_completion_tokens: int = 500,
+) -> Dict[str, Any]:
+    """
+    Igual que ask_openai, pero si ya hay una llamada en curso con los mismos
+    parámetros (p.ej. desde /coach y el modo bulk a la vez), espera y
+    reutiliza su resultado en vez de hacer otra llamada a OpenAI.
+    """
+    key = (prompt, model or OPENAI_MODEL, temperature, max_completion_tokens)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _inflight[key] = future
+
+    if not owner:
+        return future.result()
+
+    try:
+        result = ask_openai(prompt, model, temperature, max_completion_tokens)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
 def get_analysis_history(limit: int = 10):
     """
     Obtiene el historial de análisis más recientes.
@@ -143,12 +192,13 @@ def get_analysis_history(limit: int = 10):
             """,
             (limit,),
         )
-        return cursor.fetchall()
+        return [decode_row(row) for row in cursor.fetchall()]
 
 
 def get_analysis_by_id(analysis_id: int):
     """
-    Obtiene un análisis específico por ID.
+    Obtiene un análisis específico por ID. Si ya fue archivado
+    (ver storage.archive_old_analyses), lo busca en los archivos históricos.
     """
     with db_connection() as conn:
         cursor = conn.execute(
@@ -159,7 +209,8 @@ def get_analysis_by_id(analysis_id: int):
             """,
             (analysis_id,),
         )
-        return cursor.fetchone()
+        row = cursor.fetchone()
+    return decode_row(row) if row else get_archived_analysis(analysis_id)
 
 
 if __name__ == "__main__":
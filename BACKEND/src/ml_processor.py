@@ -5,6 +5,9 @@ import numpy as np
 from pydantic import BaseModel
 from typing import List, Dict, Any
 from pathlib import Path
+from scipy import sparse
+
+from .explainer import build_group_matrix, build_tree_paths, top_drivers
 
 # --- Variables Globales para Modelos ---
 model_lreg = None
@@ -17,6 +20,10 @@ metrics = {
     "brier_score": None # Tu script lo calcula, pero no lo reporta
 }
 models_loaded = []
+feature_index: Dict[str, int] = {} # columna post-dummies -> posición
+group_cols: List[str] = [] # variables originales (cat_cols + num_cols)
+group_matrix = None # dummies -> variable original (ver explainer)
+rf_paths: Dict[str, Any] = {} # atribuciones por camino precalculadas del bosque
 
 # --- Modelos Pydantic para la data ---
 # Esto define la entrada para una predicción
@@ -31,13 +38,23 @@ class AccidentInput(BaseModel):
 class BatchInput(BaseModel):
     accidents: List[AccidentInput]
 
+# Esto define un barrido de escenarios (comunas x tipos x días)
+class GridInput(BaseModel):
+    region: str
+    comunas: List[str]
+    tipos_accidente: List[str]
+    fecha_inicio: str # Espera formato "YYYY-MM-DD"
+    fecha_fin: str # Inclusive
+    leves: int = 0
+
 
 def load_models(model_path: Path = Path("models/")):
     """
     Carga todos los artefactos del modelo (.joblib) en memoria
     al iniciar la API.
     """
-    global model_lreg, model_rf, scaler, model_artifacts
+    global model_lreg, model_rf, scaler, model_artifacts, feature_index
+    global group_cols, group_matrix, rf_paths
 
     # Convertir a Path object
     model_path = Path(model_path)
@@ -47,6 +64,14 @@ def load_models(model_path: Path = Path("models/")):
         model_rf = joblib.load(model_path / "modelo_rf.joblib")
         scaler = joblib.load(model_path / "scaler.joblib")
         model_artifacts = joblib.load(model_path / "model_artifacts.joblib")
+        feature_index = {
+            col: i for i, col in enumerate(model_artifacts.get('feature_cols_post_dummies', []))
+        }
+
+        # Precalcular lo necesario para explicar predicciones en lote
+        group_cols = model_artifacts.get('cat_cols', []) + model_artifacts.get('num_cols', [])
+        group_matrix = build_group_matrix(list(feature_index), group_cols)
+        rf_paths = build_tree_paths(model_rf, group_matrix)
         
         models_loaded = [
             type(model_lreg).__name__,
@@ -61,19 +86,12 @@ def load_models(model_path: Path = Path("models/")):
         models_loaded = ["Error al cargar"]
 
 
-def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
+def engineer_features(data: pd.DataFrame) -> pd.DataFrame:
     """
-    Preprocesa el DataFrame de entrada (de la API) para que coincida
-    con los datos de entrenamiento.
+    Renombra columnas y deriva Año/Mes/DiaSemana, antes de escalar y
+    crear dummies. Sirve también para mostrar los valores de entrada
+    en las explicaciones.
     """
-    if not model_artifacts:
-        raise ValueError("Los artefactos del modelo no están cargados.")
-
-    # Extraer listas de columnas guardadas
-    CAT_COLS = model_artifacts.get('cat_cols', [])
-    NUM_COLS = model_artifacts.get('num_cols', [])
-    FEATURE_COLS_POST_DUMMIES = model_artifacts.get('feature_cols_post_dummies', [])
-
     # --- 1. Renombrar columnas (como en tu script) ---
     # El Pydantic model ya fuerza los nombres correctos (comuna -> Comuna, etc.)
     # Pero los normalizamos para el preprocesamiento
@@ -81,6 +99,7 @@ def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
         "comuna": "Comuna",
         "region": "Región",
         "tipo_accidente": "TipoAccidente",
+        "leves": "Leves",
     }
     data = data.rename(columns=rename_map)
 
@@ -89,6 +108,24 @@ def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
     data["Año"] = data["Fecha"].dt.year.fillna(2021).astype(int)
     data["Mes"] = data["Fecha"].dt.month.fillna(1).astype(int)
     data["DiaSemana"] = data["Fecha"].dt.dayofweek.fillna(0).astype(int)
+    return data
+
+
+def preprocess_data(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Preprocesa el DataFrame de entrada (de la API) para que coincida
+    con los datos de entrenamiento.
+    """
+    if not model_artifacts:
+        raise ValueError("Los artefactos del modelo no están cargados.")
+
+    # Extraer listas de columnas guardadas
+    CAT_COLS = model_artifacts.get('cat_cols', [])
+    NUM_COLS = model_artifacts.get('num_cols', [])
+    FEATURE_COLS_POST_DUMMIES = model_artifacts.get('feature_cols_post_dummies', [])
+
+    # --- 1 y 2. Renombrar columnas e ingeniería de fechas ---
+    data = engineer_features(data)
 
     # --- 3. Escalar Numéricas (como en tu script) ---
     # Asegurarse de que todas las columnas numéricas existan
@@ -125,4 +162,125 @@ def get_prediction(data: pd.DataFrame) -> np.ndarray:
     # 2. Ensamble (como en tu script)
     p_blend = 0.5 * p_lreg + 0.5 * p_rf
     
-    return p_blend
\ No newline at end of file
+    return p_blend
+
+
+def encode_category(col: str, values: List[Any]) -> np.ndarray:
+    """
+    Devuelve, para cada valor, la posición de su columna dummy
+    (p.ej. "Comuna_SANTIAGO") en 'feature_cols_post_dummies', o -1 si
+    el modelo no la conoce (equivale a la fila en cero tras el reindex).
+    """
+    return np.array(
+        [feature_index.get(f"{col}_{'desconocido' if v is None else v}", -1) for v in values],
+        dtype=np.int64,
+    )
+
+
+def scale_numeric(data: pd.DataFrame) -> np.ndarray:
+    """
+    Escala las columnas numéricas con el scaler GUARDADO, igual que
+    preprocess_data, y devuelve la matriz en el orden de 'num_cols'.
+    """
+    NUM_COLS = model_artifacts.get('num_cols', [])
+    data = data.copy()
+    for col in NUM_COLS:
+        if col not in data.columns:
+            data[col] = 0 # Valor por defecto
+    return scaler.transform(data[NUM_COLS])
+
+
+def get_prediction_matrix(X) -> np.ndarray:
+    """
+    Igual que get_prediction, pero recibe una matriz ya codificada
+    (numpy o scipy.sparse) con las columnas de 'feature_cols_post_dummies'.
+    Evita construir un DataFrame para lotes grandes.
+    """
+    if not all([model_lreg, model_rf]):
+         raise ValueError("Los modelos no están cargados.")
+
+    # 1. Regresión logística: es lineal, se evalúa directo con los coeficientes
+    z = X @ model_lreg.coef_.ravel() + model_lreg.intercept_[0]
+    p_lreg = 1.0 / (1.0 + np.exp(-np.asarray(z, dtype=np.float64).ravel()))
+
+    # 2. Random Forest: promedio de predict_proba de cada árbol (lo mismo que
+    #    hace el bosque), sin la validación de nombres de columnas
+    X_rf = X.astype(np.float32)
+    p_rf = np.zeros(X.shape[0])
+    for tree in model_rf.estimators_:
+        p_rf += tree.predict_proba(X_rf)[:, 1]
+    p_rf /= len(model_rf.estimators_)
+
+    # 3. Ensamble (como en get_prediction)
+    return 0.5 * p_lreg + 0.5 * p_rf
+
+
+def get_prediction_explained(data: pd.DataFrame):
+    """
+    Como get_prediction, pero además devuelve la atribución de cada
+    variable original (cat_cols + num_cols) al score del ensamble.
+
+    - Regresión logística: aporte lineal exacto coef * x sobre el logit,
+      llevado a probabilidad con la pendiente secante entre el intercepto
+      y el logit de la fila (así suma exactamente p_lreg - sigmoid(intercepto)).
+    - Random Forest: atribución por camino precalculada en cada hoja
+      (build_tree_paths); sólo hay que buscar la hoja de cada árbol.
+
+    Devuelve (scores, base, contribs) con scores = base + contribs.sum(axis=1);
+    contribs tiene forma (n_filas, len(group_cols)).
+    """
+    if not all([model_lreg, model_rf]) or not rf_paths:
+         raise ValueError("Los modelos no están cargados.")
+
+    X = data.to_numpy(dtype=np.float64)
+    if not np.isfinite(X).all():
+        raise ValueError("La entrada contiene valores NaN o infinitos.")
+    n = X.shape[0]
+
+    # 1. Regresión logística
+    w = model_lreg.coef_.ravel()
+    b = model_lreg.intercept_[0]
+    z = X @ w + b
+    p_lreg = 1.0 / (1.0 + np.exp(-z))
+    p0_lreg = 1.0 / (1.0 + np.exp(-b))
+    dz = z - b
+    safe_dz = np.where(np.abs(dz) > 1e-12, dz, 1.0)
+    slope = np.where(np.abs(dz) > 1e-12, (p_lreg - p0_lreg) / safe_dz, p_lreg * (1.0 - p_lreg))
+    contrib_lreg = (X @ (w[:, None] * group_matrix)) * slope[:, None]
+
+    # 2. Random Forest: hoja de cada árbol -> valor y atribución acumulada
+    #    (se valida una sola vez arriba, como hace el bosque en predict_proba)
+    X_rf = np.ascontiguousarray(X, dtype=np.float32)
+    n_trees = len(model_rf.estimators_)
+    leaves = np.empty((n, n_trees), dtype=np.int64)
+    for t, tree in enumerate(model_rf.estimators_):
+        leaves[:, t] = tree.apply(X_rf, check_input=False) + rf_paths["offsets"][t]
+    p_rf = rf_paths["node_value"][leaves].mean(axis=1)
+    hits = sparse.csr_matrix(
+        (
+            np.full(leaves.size, 1.0 / n_trees),
+            rf_paths["leaf_row"][leaves.ravel()],
+            np.arange(0, leaves.size + 1, n_trees),
+        ),
+        shape=(n, rf_paths["leaf_contrib"].shape[0]),
+    )
+    contrib_rf = hits @ rf_paths["leaf_contrib"]
+
+    # 3. Ensamble (como en get_prediction)
+    scores = 0.5 * p_lreg + 0.5 * p_rf
+    base = 0.5 * p0_lreg + 0.5 * rf_paths["base"]
+    contribs = 0.5 * contrib_lreg + 0.5 * contrib_rf
+    return scores, base, contribs
+
+
+def get_top_drivers(data: pd.DataFrame, contribs: np.ndarray, top_k: int = 3) -> List[List[Dict[str, Any]]]:
+    """
+    Top-k variables por fila a partir de las atribuciones de
+    get_prediction_explained. 'data' es el DataFrame de entrada (antes de
+    preprocess_data), usado para mostrar el valor de cada variable.
+    """
+    raw_values = engineer_features(data).reset_index(drop=True)
+    for col in model_artifacts.get('num_cols', []):
+        if col not in raw_values.columns:
+            raw_values[col] = 0 # Mismo valor por defecto que preprocess_data
+    return top_drivers(contribs, group_cols, raw_values, top_k)
@@ -0,0 +1,116 @@
+# src/risk_grid.py
+from __future__ import annotations
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from . import ml_processor
+
+# Tope de celdas (comunas x tipos x días) por barrido
+MAX_GRID_CELLS = 500_000
+
+
+def date_axis(fecha_inicio: str, fecha_fin: str) -> pd.DatetimeIndex:
+    """
+    Eje de días (inclusive) del barrido. Lanza ValueError si el rango es inválido.
+    """
+    inicio = pd.to_datetime(fecha_inicio, errors="raise")
+    fin = pd.to_datetime(fecha_fin, errors="raise")
+    if fin < inicio:
+        raise ValueError("'fecha_fin' debe ser posterior o igual a 'fecha_inicio'")
+    return pd.date_range(inicio, fin, freq="D")
+
+
+def score_grid(
+    region: str,
+    comunas: List[str],
+    tipos_accidente: List[str],
+    clases: List[str],
+    fechas: pd.DatetimeIndex,
+    leves: int = 0,
+) -> np.ndarray:
+    """
+    Evalúa el riesgo de todo el producto cartesiano comunas x tipos x días
+    en una sola pasada del ensamble y devuelve un cubo float32 de forma
+    (len(comunas), len(tipos_accidente), len(fechas)).
+
+    Los valores deben venir ya armonizados (ver _harmonize_df en la API);
+    'clases' es el 'Claseaccid' correspondiente a cada tipo de accidente.
+
+    La grilla se arma directamente en el espacio codificado (matriz dispersa
+    con las columnas de 'feature_cols_post_dummies'), sin DataFrames por fila.
+    Como la fecha sólo entra al modelo como (Año, Mes, DiaSemana), se evalúan
+    únicamente las combinaciones distintas (a lo más 12 x 7 por año) y luego
+    se expanden a todos los días.
+    """
+    if not ml_processor.model_artifacts:
+        raise ValueError("Los artefactos del modelo no están cargados.")
+
+    n_cells = len(comunas) * len(tipos_accidente) * len(fechas)
+    if n_cells > MAX_GRID_CELLS:
+        raise ValueError(
+            f"La grilla pedida tiene {n_cells} celdas; el máximo es {MAX_GRID_CELLS}. "
+            "Reduce el rango de fechas o la cantidad de comunas/tipos."
+        )
+
+    NUM_COLS = ml_processor.model_artifacts.get('num_cols', [])
+    n_features = len(ml_processor.model_artifacts.get('feature_cols_post_dummies', []))
+
+    # --- 1. Fechas -> combinaciones únicas de (Año, Mes, DiaSemana) ---
+    date_keys = (
+        fechas.year.to_numpy() * 84 + (fechas.month.to_numpy() - 1) * 7 + fechas.dayofweek.to_numpy()
+    )
+    unique_keys, date_inverse = np.unique(date_keys, return_inverse=True)
+    num_values = ml_processor.scale_numeric(
+        pd.DataFrame(
+            {
+                "Año": unique_keys // 84,
+                "Mes": unique_keys % 84 // 7 + 1,
+                "DiaSemana": unique_keys % 7,
+                "Leves": leves,
+            }
+        )
+    )
+
+    # --- 2. Índices de las columnas dummy de cada eje ---
+    region_idx = ml_processor.encode_category("Región", [region])
+    comuna_idx = ml_processor.encode_category("Comuna", comunas)
+    tipo_idx = ml_processor.encode_category("TipoAccidente", tipos_accidente)
+    clase_idx = ml_processor.encode_category("Claseaccid", clases)
+
+    n_c, n_t, n_u = len(comunas), len(tipos_accidente), len(unique_keys)
+    c_of_row, t_of_row, u_of_row = (
+        a.ravel() for a in np.meshgrid(np.arange(n_c), np.arange(n_t), np.arange(n_u), indexing="ij")
+    )
+    all_rows = np.arange(n_c * n_t * n_u)
+
+    # --- 3. Matriz dispersa (fila = escenario único, columna = feature) ---
+    rows, cols, values = [], [], []
+
+    def _add(col_of_row: np.ndarray, value_of_row) -> None:
+        known = col_of_row >= 0
+        rows.append(all_rows[known])
+        cols.append(col_of_row[known])
+        values.append(np.broadcast_to(value_of_row, col_of_row.shape)[known])
+
+    _add(np.broadcast_to(region_idx, all_rows.shape), 1.0)
+    _add(comuna_idx[c_of_row], 1.0)
+    _add(tipo_idx[t_of_row], 1.0)
+    _add(clase_idx[t_of_row], 1.0)
+    for j, col in enumerate(NUM_COLS):
+        pos = ml_processor.feature_index.get(col, -1)
+        _add(np.full(all_rows.shape, pos), num_values[u_of_row, j])
+
+    X = sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(all_rows), n_features),
+        dtype=np.float32,
+    )
+
+    # --- 4. Predecir y expandir a todos los días ---
+    scores = ml_processor.get_prediction_matrix(X).reshape(n_c, n_t, n_u)
+    return scores[:, :, date_inverse].astype(np.float32)
+
@@ -0,0 +1,224 @@
+# src/risk_layers.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from . import ml_processor
+from .risk_grid import score_grid
+
+# -------------------------------------------------------------------
+# Configuración
+# -------------------------------------------------------------------
+# GeoJSON local con un Feature (Polygon/MultiPolygon) por comuna
+GEOJSON_PATH = Path(os.getenv("COMUNAS_GEOJSON_PATH", "data/comunas.geojson"))
+NAME_PROP = os.getenv("COMUNAS_GEOJSON_NAME_PROP", "comuna")
+REGION_PROP = os.getenv("COMUNAS_GEOJSON_REGION_PROP", "region")
+MIN_ZOOM, MAX_ZOOM = 0, 18
+CACHE_SIZE = 64 # capas renderizadas en memoria (LRU)
+
+_lock = threading.Lock()
+_geometry: Optional[Dict[str, Any]] = None
+_simplified: Dict[int, List[Dict[str, Any]]] = {} # zoom -> geometrías simplificadas
+_layers: "OrderedDict[tuple, Tuple[bytes, str]]" = OrderedDict() # clave -> (cuerpo, etag)
+
+
+# -------------------------------------------------------------------
+# Geometrías
+# -------------------------------------------------------------------
+
+def _load_geometry() -> Dict[str, Any]:
+    global _geometry
+    if _geometry is None:
+        if not GEOJSON_PATH.exists():
+            raise FileNotFoundError(f"No se encontró el archivo de geometrías '{GEOJSON_PATH}'")
+        with open(GEOJSON_PATH, encoding="utf-8") as f:
+            _geometry = json.load(f)
+    return _geometry
+
+
+def _simplify_ring(ring: List[List[float]], tolerance: float) -> List[List[float]]:
+    """
+    Douglas-Peucker sobre un anillo cerrado. Si el resultado queda
+    degenerado (< 4 puntos) se devuelve el anillo original.
+    """
+    points = np.asarray(ring, dtype=float)
+    if len(points) <= 4 or tolerance <= 0:
+        return ring
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    # El primer y último punto coinciden: se parte en el punto más lejano
+    far = int(np.argmax(np.linalg.norm(points - points[0], axis=1)))
+    keep[far] = True
+    stack = [(0, far), (far, len(points) - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = points[start], points[end]
+        segment = points[start + 1:end]
+        ab = b - a
+        norm = np.hypot(*ab)
+        if norm == 0:
+            dist = np.linalg.norm(segment - a, axis=1)
+        else:
+            dist = np.abs(ab[0] * (segment[:, 1] - a[1]) - ab[1] * (segment[:, 0] - a[0])) / norm
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+
+    simplified = points[keep]
+    if len(simplified) < 4:
+        return ring
+    return simplified.round(6).tolist()
+
+
+def _simplify_geometry(geometry: Dict[str, Any], tolerance: float) -> Dict[str, Any]:
+    if geometry["type"] == "Polygon":
+        coords = [_simplify_ring(r, tolerance) for r in geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        coords = [[_simplify_ring(r, tolerance) for r in poly] for poly in geometry["coordinates"]]
+    else:
+        return geometry
+    return {"type": geometry["type"], "coordinates": coords}
+
+
+def _features_for_zoom(zoom: int) -> List[Dict[str, Any]]:
+    """
+    Features con la geometría simplificada a ~1 pixel del zoom pedido
+    (grados por pixel en un tile de 256 px). Se calcula una vez por zoom.
+    """
+    if zoom not in _simplified:
+        tolerance = 360.0 / (256 * 2 ** zoom)
+        _simplified[zoom] = [
+            {
+                "type": "Feature",
+                "geometry": _simplify_geometry(f["geometry"], tolerance),
+                "properties": f.get("properties", {}),
+            }
+            for f in _load_geometry()["features"]
+        ]
+    return _simplified[zoom]
+
+
+# -------------------------------------------------------------------
+# Riesgo por comuna
+# -------------------------------------------------------------------
+
+def period_axis(period: str) -> pd.DatetimeIndex:
+    """Días del periodo mensual "YYYY-MM"."""
+    start = pd.Period(period, freq="M")
+    return pd.date_range(start.start_time, start.end_time.normalize(), freq="D")
+
+
+def known_accident_types() -> List[str]:
+    """Tipos de accidente que el modelo conoce (columnas TipoAccidente_*)."""
+    prefix = "TipoAccidente_"
+    return [
+        col[len(prefix):]
+        for col in ml_processor.feature_index
+        if col.startswith(prefix) and col != f"{prefix}desconocido"
+    ]
+
+
+def comuna_risk(
+    comunas: List[str],
+    regions: List[str],
+    tipos: List[str],
+    clases: List[str],
+    fechas: pd.DatetimeIndex,
+) -> np.ndarray:
+    """
+    Riesgo medio de cada comuna en el periodo (promedio sobre tipos y días).
+    Se agrupa por región para evaluar cada grupo en una sola grilla.
+    """
+    risk = np.zeros(len(comunas))
+    regions_arr = np.array(regions, dtype=object)
+    for region in pd.unique(regions_arr):
+        idx = np.flatnonzero(regions_arr == region)
+        cube = score_grid(region, [comunas[i] for i in idx], tipos, clases, fechas)
+        risk[idx] = cube.mean(axis=(1, 2))
+    return risk
+
+
+# -------------------------------------------------------------------
+# Capas (con caché)
+# -------------------------------------------------------------------
+
+def render_layer(
+    period: str,
+    zoom: int,
+    fmt: str,
+    default_region: str,
+    tipos: List[str],
+    clases: List[str],
+    normalize_comuna,
+    normalize_region,
+) -> Tuple[bytes, str]:
+    """
+    Devuelve (cuerpo JSON, etag) de la capa de riesgo por comuna.
+    - fmt="geojson": FeatureCollection con risk_score/risk_level por comuna
+    - fmt="scores": sólo {comuna: risk_score}, para clientes que ya tienen la geometría
+
+    El resultado queda en caché; pedirlo de nuevo no ejecuta el modelo.
+    'normalize_comuna' y 'normalize_region' llevan los nombres de la
+    geometría (y la región por defecto) al formato del modelo, igual que
+    se armoniza una request de /predict.
+    """
+    zoom = int(min(max(zoom, MIN_ZOOM), MAX_ZOOM))
+    default_region = normalize_region(default_region)
+    key = (period, zoom if fmt == "geojson" else None, fmt, default_region, tuple(tipos))
+
+    with _lock:
+        if key in _layers:
+            _layers.move_to_end(key)
+            return _layers[key]
+
+        # "scores" no lleva geometrías: basta con las propiedades, sin simplificar
+        features = _features_for_zoom(zoom) if fmt == "geojson" else _load_geometry()["features"]
+        comunas = [normalize_comuna((f.get("properties") or {}).get(NAME_PROP, "")) for f in features]
+        regions = [
+            normalize_region((f.get("properties") or {}).get(REGION_PROP) or default_region)
+            for f in features
+        ]
+        risk = comuna_risk(comunas, regions, tipos, clases, period_axis(period))
+
+        scores = {c: round(float(r), 4) for c, r in zip(comunas, risk)}
+        if fmt == "scores":
+            payload: Dict[str, Any] = {"period": period, "risk_score": scores}
+        else:
+            payload = {
+                "type": "FeatureCollection",
+                "period": period,
+                "features": [
+                    {
+                        **f,
+                        "properties": {
+                            **f["properties"],
+                            "risk_score": scores[c],
+                            "risk_level": "ALTO" if scores[c] > 0.5 else ("MEDIO" if scores[c] > 0.25 else "BAJO"),
+                        },
+                    }
+                    for f, c in zip(features, comunas)
+                ],
+            }
+
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        _layers[key] = (body, etag)
+        if len(_layers) > CACHE_SIZE:
+            _layers.popitem(last=False)
+        return body, etag
@@ -0,0 +1,358 @@
+# src/storage.py
+from __future__ import annotations
+
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from . import database
+from .database import db_connection
+
+# -------------------------------------------------------------------
+# Compresión transparente de columnas de texto
+# -------------------------------------------------------------------
+# Valor comprimido = MAGIC + id del diccionario (4 bytes, 0 = sin diccionario) + zlib.
+# Se guarda como BLOB en la misma columna; las filas antiguas (TEXT) se leen tal cual.
+MAGIC = b"\x00ZL"
+HEADER = struct.Struct(">I")
+MIN_COMPRESS_BYTES = 256 # textos más cortos no se comprimen
+COMPRESSION_LEVEL = 6
+DICT_SIZE = 32 * 1024 # ventana de zlib: el diccionario no puede ser mayor
+
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", "archive"))
+COMPRESSED_COLUMNS = ("user_prompt", "openai_response")
+
+_archive_lock = threading.Lock() # un solo archivado a la vez por proceso
+_dicts: Dict[int, bytes] = {}
+_active_dict_id: Optional[int] = None # None = aún no se consulta la base
+
+
+def _load_dicts() -> None:
+    global _active_dict_id
+    with db_connection() as conn:
+        rows = conn.execute("SELECT id, data FROM compression_dicts ORDER BY id").fetchall()
+    _dicts.update({row["id"]: bytes(row["data"]) for row in rows})
+    _active_dict_id = rows[-1]["id"] if rows else 0
+
+
+def _get_dict(dict_id: int) -> Optional[bytes]:
+    if dict_id and dict_id not in _dicts:
+        _load_dicts()
+    return _dicts.get(dict_id)
+
+
+def encode_text(text: str) -> Union[str, bytes]:
+    """
+    Comprime un texto para guardarlo en la base con el diccionario activo.
+    Devuelve el texto original si es corto o si comprimir no ahorra espacio.
+    """
+    raw = text.encode("utf-8")
+    if len(raw) < MIN_COMPRESS_BYTES:
+        return text
+
+    if _active_dict_id is None:
+        _load_dicts()
+    zdict = _dicts.get(_active_dict_id)
+    compressor = (
+        zlib.compressobj(COMPRESSION_LEVEL, zdict=zdict) if zdict else zlib.compressobj(COMPRESSION_LEVEL)
+    )
+    data = compressor.compress(raw) + compressor.flush()
+
+    encoded = MAGIC + HEADER.pack(_active_dict_id if zdict else 0) + data
+    return encoded if len(encoded) < len(raw) else text
+
+
+def decode_text(value: Any) -> Any:
+    """Inverso de encode_text. Los valores no comprimidos se devuelven sin cambios."""
+    if not isinstance(value, (bytes, memoryview)) or not bytes(value[:len(MAGIC)]) == MAGIC:
+        return value
+    value = bytes(value)
+    (dict_id,) = HEADER.unpack_from(value, len(MAGIC))
+    zdict = _get_dict(dict_id)
+    decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+    data = decompressor.decompress(value[len(MAGIC) + HEADER.size:]) + decompressor.flush()
+    return data.decode("utf-8")
+
+
+def decode_row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    """Convierte una fila de accident_analysis a dict con los textos descomprimidos."""
+    if row is None:
+        return None
+    result = dict(row)
+    for col in COMPRESSED_COLUMNS:
+        if col in result:
+            result[col] = decode_text(result[col])
+    return result
+
+
+def train_dictionary(sample_size: int = 500) -> Dict[str, Any]:
+    """
+    Entrena un diccionario compartido con las respuestas más recientes:
+    las líneas que más se repiten, con las más frecuentes al final
+    (zlib encuentra mejor las coincidencias cercanas). Pasa a ser el
+    diccionario activo para las nuevas escrituras.
+    """
+    global _active_dict_id
+    with db_connection() as conn:
+        rows = conn.execute(
+            "SELECT openai_response FROM accident_analysis ORDER BY id DESC LIMIT ?",
+            (sample_size,),
+        ).fetchall()
+
+    counts: Counter = Counter()
+    for row in rows:
+        for line in decode_text(row["openai_response"]).splitlines():
+            line = line.strip()
+            if len(line) >= 8:
+                counts[line] += 1
+
+    chosen: List[bytes] = []
+    size = 0
+    for line, n in counts.most_common():
+        if n < 2:
+            break
+        data = line.encode("utf-8") + b"\n"
+        if size + len(data) > DICT_SIZE:
+            break
+        chosen.append(data)
+        size += len(data)
+
+    if not chosen:
+        return {"trained": False, "samples": len(rows)}
+
+    zdict = b"".join(reversed(chosen))
+    with db_connection() as conn:
+        cursor = conn.execute("INSERT INTO compression_dicts (data) VALUES (?)", (zdict,))
+        dict_id = cursor.lastrowid
+    _dicts[dict_id] = zdict
+    _active_dict_id = dict_id
+    return {"trained": True, "dict_id": dict_id, "samples": len(rows), "dict_bytes": len(zdict)}
+
+
+# -------------------------------------------------------------------
+# Archivado por antigüedad
+# -------------------------------------------------------------------
+
+def _archive_connection(path: Union[str, Path]) -> sqlite3.Connection:
+    """Conexión de sólo lectura a un archivo de archivo histórico."""
+    conn = sqlite3.connect(f"file:{Path(path).resolve()}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def get_archived_analysis(analysis_id: int) -> Optional[Dict[str, Any]]:
+    """Busca un análisis en los archivos históricos que cubren su id."""
+    with db_connection() as conn:
+        archives = conn.execute(
+            "SELECT path FROM analysis_archives WHERE ? BETWEEN min_id AND max_id ORDER BY id DESC",
+            (analysis_id,),
+        ).fetchall()
+
+    for archive in archives:
+        conn = _archive_connection(archive["path"])
+        try:
+            row = conn.execute(
+                """
+                SELECT id, user_prompt, openai_response, tokens_used, model_used, created_at
+                FROM accident_analysis
+                WHERE id = ?
+                """,
+                (analysis_id,),
+            ).fetchone()
+        finally:
+            conn.close()
+        if row:
+            return decode_row(row)
+    return None
+
+
+def archive_old_analyses(days: int, vacuum: bool = False) -> Dict[str, Any]:
+    """
+    Mueve los análisis con más de 'days' días a un archivo SQLite comprimido
+    de sólo lectura en ARCHIVE_DIR y los borra de la base principal.
+    Siguen disponibles vía get_analysis_by_id. Con vacuum=True se compacta
+    la base principal para devolver el espacio al sistema.
+
+    Es seguro ante interrupciones y se puede reintentar: el archivo se arma
+    en un temporal que sólo se renombra al terminar, y las filas se borran
+    de la base en la misma transacción que registra el archivo. Los ids que
+    ya cubre un archivo registrado nunca se vuelven a archivar. Las llamadas
+    concurrentes se serializan: la segunda espera y no encuentra nada nuevo.
+    """
+    with _archive_lock:
+        return _archive_old_analyses(days, vacuum)
+
+
+def _archive_old_analyses(days: int, vacuum: bool) -> Dict[str, Any]:
+    size_before = os.path.getsize(database.DB_PATH)
+    with db_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT id, user_prompt, openai_response, tokens_used, model_used, created_at, batch_id
+            FROM accident_analysis
+            WHERE created_at < datetime('now', ?)
+              AND NOT EXISTS (
+                  SELECT 1 FROM analysis_archives a
+                  WHERE accident_analysis.id BETWEEN a.min_id AND a.max_id
+              )
+            ORDER BY id
+            """,
+            (f"-{int(days)} days",),
+        ).fetchall()
+
+    if not rows:
+        return {"archived_rows": 0}
+
+    ids = [row["id"] for row in rows]
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    path = ARCHIVE_DIR / f"accident_analysis_{ids[0]}_{ids[-1]}.db"
+    tmp_path = path.with_name(path.name + ".tmp")
+    # Restos de un intento interrumpido (el archivo final, si quedó, no está
+    # registrado porque el registro y el borrado son una sola transacción)
+    tmp_path.unlink(missing_ok=True)
+
+    raw_bytes = 0
+    try:
+        archive = sqlite3.connect(tmp_path)
+        try:
+            archive.execute(
+                """
+                CREATE TABLE accident_analysis (
+                    id INTEGER PRIMARY KEY,
+                    user_prompt TEXT NOT NULL,
+                    openai_response TEXT NOT NULL,
+                    tokens_used INTEGER,
+                    model_used TEXT,
+                    created_at TIMESTAMP,
+                    batch_id TEXT
+                )
+                """
+            )
+            records = []
+            for row in (decode_row(r) for r in rows):
+                raw_bytes += sum(len(row[col].encode("utf-8")) for col in COMPRESSED_COLUMNS)
+                records.append(
+                    (
+                        row["id"],
+                        encode_text(row["user_prompt"]),
+                        encode_text(row["openai_response"]),
+                        row["tokens_used"],
+                        row["model_used"],
+                        row["created_at"],
+                        row["batch_id"],
+                    )
+                )
+            archive.executemany("INSERT INTO accident_analysis VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+            archive.commit()
+            archive.execute("VACUUM")
+        finally:
+            archive.close()
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    with db_connection() as conn:
+        conn.execute(
+            "INSERT INTO analysis_archives (path, min_id, max_id, rows) VALUES (?, ?, ?, ?)",
+            (str(path), ids[0], ids[-1], len(ids)),
+        )
+        conn.executemany("DELETE FROM accident_analysis WHERE id = ?", [(i,) for i in ids])
+
+    if vacuum:
+        conn = sqlite3.connect(database.DB_PATH)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+    archive_bytes = os.path.getsize(path)
+    return {
+        "archived_rows": len(ids),
+        "archive_file": str(path),
+        "raw_text_bytes": raw_bytes,
+        "archive_file_bytes": archive_bytes,
+        "db_bytes_before": size_before,
+        "db_bytes_after": os.path.getsize(database.DB_PATH),
+        "read_latency_ms": _lookup_latency(ids[:: max(1, len(ids) // 20)]),
+    }
+
+
+# -------------------------------------------------------------------
+# Reporte de espacio y latencia
+# -------------------------------------------------------------------
+
+def _lookup_latency(ids: List[int]) -> Optional[float]:
+    """Latencia media (ms) de get_analysis_by_id para los ids dados."""
+    from .gpt_client import get_analysis_by_id
+
+    if not ids:
+        return None
+    start = time.perf_counter()
+    for analysis_id in ids:
+        get_analysis_by_id(analysis_id)
+    return round((time.perf_counter() - start) * 1000 / len(ids), 3)
+
+
+def storage_report(sample: int = 100) -> Dict[str, Any]:
+    """
+    Tamaño de la base y de los archivos, ahorro de la compresión (sobre una
+    muestra de filas comprimidas) y latencia de lectura en base vs archivo.
+    """
+    with db_connection() as conn:
+        totals = conn.execute(
+            """
+            SELECT COUNT(*) AS rows,
+                   SUM(typeof(openai_response) = 'blob') AS compressed_rows
+            FROM accident_analysis
+            """
+        ).fetchone()
+        compressed = conn.execute(
+            """
+            SELECT user_prompt, openai_response FROM accident_analysis
+            WHERE typeof(openai_response) = 'blob'
+            ORDER BY id DESC LIMIT ?
+            """,
+            (sample,),
+        ).fetchall()
+        main_ids = [r["id"] for r in conn.execute(
+            "SELECT id FROM accident_analysis ORDER BY id DESC LIMIT ?", (sample,)
+        )]
+        archives = conn.execute("SELECT path, min_id, max_id, rows FROM analysis_archives").fetchall()
+
+    stored = decoded = 0
+    start = time.perf_counter()
+    for row in compressed:
+        for col in COMPRESSED_COLUMNS:
+            value = row[col]
+            stored += len(value) if isinstance(value, bytes) else len(value.encode("utf-8"))
+            decoded += len(decode_text(value).encode("utf-8"))
+    decode_ms = (time.perf_counter() - start) * 1000
+
+    archived_ids = [a["min_id"] for a in archives[-sample:]]
+    return {
+        "db_bytes": os.path.getsize(database.DB_PATH),
+        "rows": totals["rows"],
+        "compressed_rows": totals["compressed_rows"] or 0,
+        "sample_compression_ratio": round(decoded / stored, 3) if stored else None,
+        "sample_decode_ms_per_row": round(decode_ms / len(compressed), 4) if compressed else None,
+        "archives": [
+            {
+                "path": a["path"],
+                "rows": a["rows"],
+                "bytes": os.path.getsize(a["path"]) if os.path.exists(a["path"]) else None,
+            }
+            for a in archives
+        ],
+        "read_latency_ms": {
+            "db": _lookup_latency(main_ids),
+            "archive": _lookup_latency(archived_ids),
+        },
+    }
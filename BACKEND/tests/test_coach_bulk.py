@@ -0,0 +1,213 @@
+# tests/test_coach_bulk.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+from openai import OpenAI
+
+from src import coach_bulk, gpt_client
+
+
+class _StubOpenAI:
+    """
+    Servidor local compatible con /v1/chat/completions. Registra cada prompt
+    recibido y permite simular 429, errores 400 y latencia.
+    """
+
+    def __init__(self):
+        self.requests = [] # (instante, prompt)
+        self.rate_limit_next = 0
+        self.reject = set() # prompts que responden 400
+        self.delay = 0.0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prompt = body["messages"][-1]["content"]
+                with stub._lock:
+                    stub.requests.append((time.monotonic(), prompt))
+                    limited = stub.rate_limit_next > 0
+                    stub.rate_limit_next -= limited
+                time.sleep(stub.delay)
+
+                if limited:
+                    self._send(429, {"error": {"message": "Rate limit", "type": "requests", "code": "rate_limit_exceeded"}})
+                elif any(r in prompt for r in stub.reject):
+                    self._send(400, {"error": {"message": "Prompt rechazado", "type": "invalid_request_error"}})
+                else:
+                    self._send(200, {
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion",
+                        "created": 0,
+                        "model": body["model"],
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": f"Plan para: {prompt}"},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": {"prompt_tokens": 3, "completion_tokens": 5, "total_tokens": 8},
+                    })
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def prompts(self):
+        with self._lock:
+            return [p for _, p in self.requests]
+
+
+@pytest.fixture
+def stub(db, monkeypatch):
+    server = _StubOpenAI()
+    monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+    # Sin reintentos del SDK: el backoff lo decide coach_bulk
+    monkeypatch.setattr(gpt_client, "client", OpenAI(api_key="test-key", max_retries=0))
+    monkeypatch.setattr(coach_bulk, "_pacer", coach_bulk._Pacer(0))
+    monkeypatch.setattr(coach_bulk, "BACKOFF_BASE", 0.2)
+    coach_bulk.jobs.clear()
+    yield server
+    server.server.shutdown()
+
+
+def test_duplicate_prompts_are_coalesced(stub):
+    job = coach_bulk.run_bulk_coaching(["Comuna MAIPU", " Comuna MAIPU", "Comuna LA FLORIDA", "Comuna MAIPU "])
+
+    assert (job["status"], job["total"], job["done"], job["failed"]) == ("finished", 2, 2, 0)
+    assert sorted(stub.prompts()) == [
+        coach_bulk.coaching_prompt("Comuna LA FLORIDA"),
+        coach_bulk.coaching_prompt("Comuna MAIPU"),
+    ]
+
+
+def test_rerun_skips_prompts_already_answered(stub):
+    prompts = ["Comuna A", "Comuna B", "Comuna C"]
+    stub.reject = {"Comuna B"}
+    first = coach_bulk.run_bulk_coaching(prompts, batch_id="lote-1")
+    assert (first["done"], first["failed"]) == (2, 1)
+
+    stub.reject = set()
+    stub.requests.clear()
+    second = coach_bulk.run_bulk_coaching(prompts, batch_id="lote-1")
+
+    assert stub.prompts() == [coach_bulk.coaching_prompt("Comuna B")]
+    assert (second["done"], second["skipped"], second["failed"]) == (3, 2, 0)
+
+
+def test_rate_limit_backs_off_and_retries(stub):
+    stub.rate_limit_next = 1
+
+    job = coach_bulk.run_bulk_coaching(["Comuna MAIPU"])
+
+    assert (job["done"], job["failed"]) == (1, 0)
+    (t0, _), (t1, _) = stub.requests
+    assert t1 - t0 >= coach_bulk.BACKOFF_BASE
+
+
+def test_concurrent_identical_calls_share_one_request(stub):
+    stub.delay = 0.3
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(gpt_client.ask_openai_shared("mismo prompt")))
+        for _ in range(2)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert stub.prompts() == ["mismo prompt"]
+    assert results[0]["analysis_id"] == results[1]["analysis_id"]
+
+
+def test_shared_answer_counts_for_every_batch(stub):
+    stub.delay = 0.3
+    threads = [
+        threading.Thread(target=coach_bulk.run_bulk_coaching, args=(["Comuna MAIPU"], batch_id))
+        for batch_id in ("lote-a", "lote-b")
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(stub.requests) == 1
+    coach_bulk.jobs.clear()
+    assert coach_bulk.get_job("lote-a")["done"] == coach_bulk.get_job("lote-b")["done"] == 1
+
+
+def test_concurrent_batches_share_the_rate_limit(stub, monkeypatch):
+    # La primera llamada del cliente tarda en establecerse: se hace antes de medir
+    gpt_client.ask_openai("calentamiento")
+    stub.requests.clear()
+    monkeypatch.setattr(coach_bulk, "_pacer", coach_bulk._Pacer(600)) # 0.1 s entre llamadas
+    threads = [
+        threading.Thread(target=coach_bulk.run_bulk_coaching, args=([f"{name} {i}" for i in range(3)], name, 3))
+        for name in ("lote-a", "lote-b")
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    times = sorted(t for t, _ in stub.requests)
+    assert len(times) == 6
+    assert min(np.diff(times)) >= 0.09
+
+
+def test_rate_limit_in_one_batch_slows_the_others(stub):
+    stub.rate_limit_next = 1
+    first = threading.Thread(target=coach_bulk.run_bulk_coaching, args=(["Comuna A"], "lote-a"))
+    first.start()
+    # El lote B arranca cuando A ya recibió el 429 y está en backoff
+    time.sleep(0.1)
+    second = threading.Thread(target=coach_bulk.run_bulk_coaching, args=(["Comuna B"], "lote-b"))
+    second.start()
+    first.join()
+    second.join()
+
+    sent = {p: t for t, p in reversed(stub.requests)} # primer envío de cada prompt
+    t_429 = stub.requests[0][0]
+    assert len(stub.requests) == 3
+    assert sent[coach_bulk.coaching_prompt("Comuna B")] - t_429 >= coach_bulk.BACKOFF_BASE
+
+
+def test_resubmitting_a_running_batch_attaches_to_it(stub):
+    stub.delay = 0.3
+    runner = threading.Thread(target=coach_bulk.run_bulk_coaching, args=(["Comuna A", "Comuna B"], "lote-1", 1))
+    runner.start()
+    while coach_bulk.get_job("lote-1") is None:
+        time.sleep(0.01)
+
+    again = coach_bulk.run_bulk_coaching(["Comuna A", "Comuna B"], "lote-1")
+    runner.join()
+
+    assert again["status"] == "running"
+    assert sorted(stub.prompts()) == [coach_bulk.coaching_prompt("Comuna A"), coach_bulk.coaching_prompt("Comuna B")]
+
+
+def test_concurrency_is_clamped(monkeypatch):
+    monkeypatch.setattr(coach_bulk, "BULK_CONCURRENCY_MAX", 8)
+
+    assert coach_bulk.clamp_concurrency(0) == 1
+    assert coach_bulk.clamp_concurrency(-5) == 1
+    assert coach_bulk.clamp_concurrency(3) == 3
+    assert coach_bulk.clamp_concurrency(10_000) == 8
@@ -0,0 +1,133 @@
+# tests/test_drift_monitor.py
+import json
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from conftest import best_of, random_accidents
+from src import drift_monitor
+from src.drift_monitor import DriftMonitor
+
+
+def _snapshot_rows(db):
+    with db.db_connection() as conn:
+        return conn.execute(
+            "SELECT is_reference, payload, created_at FROM drift_snapshots ORDER BY id"
+        ).fetchall()
+
+
+def test_identical_windows_report_no_drift(models, db):
+    input_df = random_accidents(400, seed=5)
+    scores = np.random.default_rng(5).random(len(input_df))
+
+    monitor = DriftMonitor()
+    monitor.observe(input_df, scores)
+    assert monitor.set_reference() == {"reference_rows": 400}
+    monitor.observe(input_df, scores)
+
+    report = monitor.report()
+    assert report["rows"] == report["reference_rows"] == 400
+    assert report["risk_score"]["psi"] == pytest.approx(0.0, abs=1e-12)
+    assert report["risk_score"]["ks"] == pytest.approx(0.0, abs=1e-12)
+    for col in ("Comuna", "TipoAccidente", "Mes"):
+        assert report["features"][col]["psi"] == pytest.approx(0.0, abs=1e-12)
+        assert report["features"][col]["new_categories"] == []
+
+
+def test_unknown_category_rate(models, db):
+    input_df = random_accidents(10, seed=2)
+    input_df.loc[:2, "comuna"] = "COMUNA INVENTADA"
+
+    monitor = DriftMonitor()
+    monitor.observe(input_df, np.full(10, 0.5))
+
+    report = monitor.report()
+    assert report["unknown_rate"]["Comuna"] == pytest.approx(0.3)
+    assert "TipoAccidente" not in report["unknown_rate"]
+
+
+def test_window_rotates_after_window_seconds(models, db, monkeypatch):
+    clock = [1_000_000.0]
+    fake_time = SimpleNamespace(time=lambda: clock[0], monotonic=time.monotonic)
+    monkeypatch.setattr(drift_monitor, "time", fake_time)
+    input_df = random_accidents(20, seed=4)
+
+    monitor = DriftMonitor()
+    monitor.observe(input_df, np.full(20, 0.2))
+    clock[0] += drift_monitor.WINDOW_SECONDS - 1
+    assert monitor.report()["rows"] == 20
+
+    clock[0] += 1
+    report = monitor.report()
+    assert report["rows"] == 0
+    assert report["window_started_at"] == clock[0]
+    # La ventana cerrada queda guardada como snapshot
+    closed = [json.loads(r["payload"]) for r in _snapshot_rows(db) if not r["is_reference"]]
+    assert [c["n"] for c in closed] == [20]
+
+
+def test_old_snapshots_are_pruned_but_references_kept(db):
+    with db.db_connection() as conn:
+        for is_reference in (0, 1):
+            conn.execute(
+                """
+                INSERT INTO drift_snapshots (is_reference, payload, created_at)
+                VALUES (?, '{}', datetime('now', '-90 days'))
+                """,
+                (is_reference,),
+            )
+
+    DriftMonitor()._save(json.dumps({"n": 1}), False)
+
+    rows = _snapshot_rows(db)
+    assert [(r["is_reference"], r["payload"]) for r in rows] == [(1, "{}"), (0, '{"n": 1}')]
+
+
+def _save_current(monitor):
+    monitor.flush()
+    with monitor._lock:
+        payload = json.dumps(monitor._state)
+    monitor._save(payload, False)
+
+
+def test_current_window_survives_restart(models, db):
+    input_df = random_accidents(30, seed=8)
+    monitor = DriftMonitor()
+    monitor.observe(input_df.iloc[:10], np.full(10, 0.1))
+    # Snapshot periódico previo a la referencia: no debe volver tras reiniciar
+    _save_current(monitor)
+    monitor.set_reference()
+
+    restarted = DriftMonitor()
+    restarted.load_snapshots()
+    report = restarted.report()
+    assert (report["rows"], report["reference_rows"]) == (0, 10)
+
+    monitor.observe(input_df.iloc[10:], np.full(20, 0.9))
+    _save_current(monitor)
+
+    restarted = DriftMonitor()
+    restarted.load_snapshots()
+
+    report = restarted.report()
+    assert (report["rows"], report["reference_rows"]) == (20, 10)
+    assert report["risk_score"]["ks"] == pytest.approx(1.0)
+
+
+def test_observe_adds_no_measurable_latency(models, db):
+    input_df = random_accidents(1, seed=9)
+    monitor = DriftMonitor()
+    predict = lambda: models.get_prediction(models.preprocess_data(input_df))
+    scores = predict()
+
+    def observe_many():
+        for _ in range(100):
+            monitor.observe(input_df, scores)
+
+    observe = best_of(observe_many) / 100
+    prediction = best_of(predict)
+
+    assert observe < 0.05 * prediction, f"observe {observe * 1e3:.3f} ms, predicción {prediction * 1e3:.3f} ms"
+    assert monitor.report()["rows"] == 300
@@ -0,0 +1,39 @@
+# tests/test_explainer.py
+import numpy as np
+
+from conftest import best_of, random_accidents
+
+
+def test_attributions_add_up_to_the_blended_score(models):
+    input_df = random_accidents(500, seed=7)
+    processed = models.preprocess_data(input_df)
+
+    scores, base, contribs = models.get_prediction_explained(processed)
+
+    assert contribs.shape == (500, len(models.group_cols))
+    np.testing.assert_allclose(scores, base + contribs.sum(axis=1), atol=1e-9)
+    np.testing.assert_allclose(scores, models.get_prediction(processed), atol=1e-6)
+
+
+def test_top_drivers_report_input_values(models):
+    input_df = random_accidents(5, seed=3)
+    processed = models.preprocess_data(input_df)
+    _, _, contribs = models.get_prediction_explained(processed)
+
+    drivers = models.get_top_drivers(input_df, contribs, top_k=3)
+
+    assert len(drivers) == 5 and all(len(d) == 3 for d in drivers)
+    first = {d["feature"]: d["value"] for d in drivers[0]}
+    if "Comuna" in first:
+        assert first["Comuna"] == input_df["comuna"].iloc[0]
+    magnitudes = [abs(d["contribution"]) for d in drivers[0]]
+    assert magnitudes == sorted(magnitudes, reverse=True)
+
+
+def test_explained_prediction_within_twice_plain_cost(models):
+    processed = models.preprocess_data(random_accidents(10_000, seed=11))
+
+    plain = best_of(lambda: models.get_prediction(processed))
+    explained = best_of(lambda: models.get_prediction_explained(processed))
+
+    assert explained <= 2 * plain, f"plain {plain:.3f}s, explain {explained:.3f}s"
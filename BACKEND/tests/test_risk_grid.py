@@ -0,0 +1,94 @@
+# tests/test_risk_grid.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.risk_grid import date_axis, score_grid
+
+
+@pytest.mark.parametrize("leves", [0, 5])
+def test_score_grid_matches_single_predictions(models, leves):
+    region = "REGION METROPOLITANA"
+    comunas = ["SANTIAGO", "MAIPU", "COMUNA INVENTADA"]
+    tipos = ["CHOQUE", "ATROPELLO"]
+    clases = ["Colision", "1.0"]
+    # Cruza un cambio de año: el año también es una variable del modelo
+    fechas = date_axis("2023-12-25", "2024-01-10")
+
+    cube = score_grid(region, comunas, tipos, clases, fechas, leves=leves)
+    assert cube.shape == (3, 2, len(fechas))
+
+    cells = [(c, t, d) for c in range(3) for t in range(2) for d in (0, 6, 7, len(fechas) - 1)]
+    input_df = pd.DataFrame(
+        {
+            "comuna": [comunas[c] for c, _, _ in cells],
+            "region": region,
+            "tipo_accidente": [tipos[t] for _, t, _ in cells],
+            "Claseaccid": [clases[t] for _, t, _ in cells],
+            "leves": leves,
+            "fecha": [fechas[d].strftime("%Y-%m-%d") for _, _, d in cells],
+        }
+    )
+    expected = models.get_prediction(models.preprocess_data(input_df))
+
+    got = np.array([cube[c, t, d] for c, t, d in cells])
+    np.testing.assert_allclose(got, expected, rtol=1e-5, atol=1e-6)
+
+
+def _known(models, prefix, n):
+    cols = models.model_artifacts["feature_cols_post_dummies"]
+    return [c[len(prefix):] for c in cols if c.startswith(prefix) and not c.endswith("_desconocido")][:n]
+
+
+def test_grid_endpoint_full_year_sweep_is_fast(models):
+    import time
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    comunas = _known(models, "Comuna_", 52)
+    tipos = _known(models, "TipoAccidente_", 6)
+    payload = {
+        "region": "METROPOLITANA",
+        "comunas": comunas,
+        "tipos_accidente": tipos,
+        "fecha_inicio": "2024-01-01",
+        "fecha_fin": "2024-12-30",
+    }
+    client = TestClient(app)
+    client.post("/api/risk/grid?format=binary", json=payload)  # calentamiento
+
+    start = time.perf_counter()
+    response = client.post(
+        "/api/risk/grid?format=binary",
+        json=payload,
+        headers={"Origin": "http://localhost:4200"},
+    )
+    elapsed = time.perf_counter() - start
+
+    assert response.status_code == 200
+    assert response.headers["X-Grid-Shape"] == "52,6,365"
+    cube = np.frombuffer(response.content, dtype="<f4").reshape(52, 6, 365)
+    assert np.all((cube >= 0) & (cube <= 1))
+    # El navegador sólo puede leer los headers expuestos por CORS
+    exposed = response.headers["access-control-expose-headers"]
+    assert "X-Grid-Shape" in exposed and "X-Grid-Comunas" in exposed
+    assert elapsed < 1.0, f"365 x 52 x 6 tardó {elapsed:.2f}s"
+
+
+def test_grid_endpoint_rejects_oversized_sweeps(models):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    response = TestClient(app).post(
+        "/api/risk/grid",
+        json={
+            "region": "METROPOLITANA",
+            "comunas": _known(models, "Comuna_", 52),
+            "tipos_accidente": _known(models, "TipoAccidente_", 6),
+            "fecha_inicio": "2000-01-01",
+            "fecha_fin": "2024-12-31",
+        },
+    )
+    assert response.status_code == 400
+    assert "celdas" in response.json()["detail"]
@@ -0,0 +1,132 @@
+# tests/test_risk_layers.py
+import json
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src import risk_layers
+
+FIXTURE = Path(__file__).parent / "fixtures" / "comunas.geojson"
+
+
+def _line(a, b, steps):
+    return [[a[0] + (b[0] - a[0]) * t / steps, a[1] + (b[1] - a[1]) * t / steps] for t in range(steps)]
+
+
+def test_douglas_peucker_drops_collinear_points():
+    corners = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+    ring = sum((_line(a, b, 5) for a, b in zip(corners, corners[1:])), []) + [[0, 0]]
+
+    simplified = risk_layers._simplify_ring(ring, tolerance=0.01)
+
+    assert simplified[0] == simplified[-1]
+    assert sorted(map(tuple, simplified[:-1])) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+
+def test_douglas_peucker_keeps_detail_above_tolerance():
+    ring = [[0, 0], [0.5, 0], [1, 0], [1, 1], [0.5, 1.2], [0, 1], [0, 0]]
+
+    assert [0.5, 1.2] in risk_layers._simplify_ring(ring, tolerance=0.1)
+    assert [0.5, 1.2] not in risk_layers._simplify_ring(ring, tolerance=0.5)
+
+
+def test_douglas_peucker_never_degenerates():
+    ring = [[0, 0], [1e-6, 0], [1e-6, 1e-6], [0, 1e-6], [0, 5e-7], [0, 0]]
+
+    simplified = risk_layers._simplify_ring(ring, tolerance=1.0)
+
+    assert len(simplified) >= 4 and simplified[0] == simplified[-1]
+
+
+@pytest.fixture
+def layers(models, monkeypatch):
+    monkeypatch.setattr(risk_layers, "GEOJSON_PATH", FIXTURE)
+    monkeypatch.setattr(risk_layers, "_geometry", None)
+    monkeypatch.setattr(risk_layers, "_simplified", {})
+    monkeypatch.setattr(risk_layers, "_layers", OrderedDict())
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    return TestClient(app)
+
+
+def test_layer_is_simplified_and_served_with_etag(layers):
+    params = {"period": "2024-03", "zoom": 8, "tipos_accidente": ["CHOQUE", "ATROPELLO"]}
+    first = layers.get("/api/risk/layers/comunas", params=params)
+
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "application/geo+json"
+    body = first.json()
+    raw = json.loads(FIXTURE.read_text(encoding="utf-8"))["features"]
+    assert [f["properties"]["comuna"] for f in body["features"]] == [f["properties"]["comuna"] for f in raw]
+    ring = body["features"][0]["geometry"]["coordinates"][0]
+    assert len(ring) < len(raw[0]["geometry"]["coordinates"][0]) and ring[0] == ring[-1]
+    assert all(0 <= f["properties"]["risk_score"] <= 1 for f in body["features"])
+
+    etag = first.headers["ETag"]
+    cached = layers.get("/api/risk/layers/comunas", params=params, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["ETag"] == etag
+
+    # A zoom 18 el detalle fino sobrevive a la simplificación: otra capa, otro ETag
+    other = layers.get("/api/risk/layers/comunas", params={**params, "zoom": 18}, headers={"If-None-Match": etag})
+    assert other.status_code == 200 and other.headers["ETag"] != etag
+
+
+def test_scores_format_skips_geometry_simplification(layers):
+    params = {"period": "2024-03", "tipos_accidente": ["CHOQUE"]}
+    scores = layers.get("/api/risk/layers/comunas", params={**params, "format": "scores"})
+
+    assert scores.status_code == 200
+    assert risk_layers._simplified == {}
+    risk = scores.json()["risk_score"]
+    assert set(risk) == {"SANTIAGO", "PROVIDENCIA", "MAIPU", "PENALOLEN", "LAS CONDES"}
+
+    geojson = layers.get("/api/risk/layers/comunas", params=params).json()
+    for feature in geojson["features"]:
+        name = feature["properties"]["comuna"]
+        key = "PENALOLEN" if name == "Peñalolén" else name.upper().replace("Ú", "U")
+        assert feature["properties"]["risk_score"] == risk[key]
+
+
+def test_layer_scores_match_the_grid(layers, models):
+    from src.risk_grid import score_grid
+
+    response = layers.get(
+        "/api/risk/layers/comunas",
+        params={"period": "2024-02", "format": "scores", "tipos_accidente": ["CHOQUE"]},
+    )
+    risk = response.json()["risk_score"]
+
+    fechas = risk_layers.period_axis("2024-02")
+    cube = score_grid("METROPOLITANA", ["MAIPU"], ["CHOQUE"], ["Colision"], fechas)
+    assert len(fechas) == 29
+    assert risk["MAIPU"] == pytest.approx(float(np.mean(cube)), abs=1e-4)
+
+
+def test_every_region_is_normalized_like_predict(layers, models):
+    from src.risk_grid import score_grid
+
+    params = {"period": "2024-02", "format": "scores", "tipos_accidente": ["CHOQUE"]}
+    default = layers.get("/api/risk/layers/comunas", params=params)
+    alias = layers.get("/api/risk/layers/comunas", params={**params, "region": "RM"})
+
+    assert alias.headers["ETag"] == default.headers["ETag"]
+    # Providencia trae "REGION METROPOLITANA" en el GeoJSON; sus vecinas usan la región por defecto
+    fechas = risk_layers.period_axis("2024-02")
+    risk = default.json()["risk_score"]
+    for comuna in ("PROVIDENCIA", "SANTIAGO"):
+        cube = score_grid("METROPOLITANA", [comuna], ["CHOQUE"], ["Colision"], fechas)
+        assert risk[comuna] == pytest.approx(float(np.mean(cube)), abs=1e-4)
+
+
+def test_missing_geojson_returns_503(layers, monkeypatch, tmp_path):
+    monkeypatch.setattr(risk_layers, "GEOJSON_PATH", tmp_path / "no-existe.geojson")
+
+    response = layers.get("/api/risk/layers/comunas", params={"period": "2024-03"})
+
+    assert response.status_code == 503
@@ -0,0 +1,169 @@
+# tests/test_storage.py
+import os
+import sqlite3
+
+import pytest
+
+from src import storage
+from src.gpt_client import get_analysis_by_id, get_analysis_history
+
+RESPONSE = "\n".join(
+    [
+        "Plan de coaching vial para la comuna:",
+        "1. Reforzar la fiscalización de velocidad en horario punta.",
+        "2. Mejorar la señalética en los cruces con más atropellos.",
+        "3. Campañas de educación vial en colegios cercanos.",
+        "Indicador: reducción de accidentes graves en 6 meses.",
+    ]
+)
+
+
+@pytest.fixture
+def store(db, tmp_path, monkeypatch):
+    """Base temporal con el caché de diccionarios vacío (como tras reiniciar)."""
+    monkeypatch.setattr(storage, "_dicts", {})
+    monkeypatch.setattr(storage, "_active_dict_id", None)
+    monkeypatch.setattr(storage, "ARCHIVE_DIR", tmp_path / "archive")
+    return db
+
+
+def _insert(db, prompt, response, days_ago=0, batch_id=None, encode=True):
+    with db.db_connection() as conn:
+        cursor = conn.execute(
+            """
+            INSERT INTO accident_analysis
+            (user_prompt, openai_response, tokens_used, model_used, created_at, batch_id)
+            VALUES (?, ?, 10, 'gpt-test', datetime('now', ?), ?)
+            """,
+            (
+                storage.encode_text(prompt) if encode else prompt,
+                storage.encode_text(response) if encode else response,
+                f"-{days_ago} days",
+                batch_id,
+            ),
+        )
+        return cursor.lastrowid
+
+
+def test_plain_text_rows_are_read_unchanged(store):
+    long_text = RESPONSE * 5
+    analysis_id = _insert(store, "prompt antiguo", long_text, encode=False)
+
+    row = get_analysis_by_id(analysis_id)
+
+    assert (row["user_prompt"], row["openai_response"]) == ("prompt antiguo", long_text)
+    assert storage.encode_text("corto") == "corto"
+
+
+def test_round_trip_without_dictionary(store):
+    text = RESPONSE * 5
+
+    encoded = storage.encode_text(text)
+
+    assert isinstance(encoded, bytes) and encoded.startswith(storage.MAGIC)
+    assert storage.HEADER.unpack_from(encoded, len(storage.MAGIC)) == (0,)
+    assert len(encoded) < len(text.encode("utf-8"))
+    assert storage.decode_text(encoded) == text
+
+    _insert(store, "prompt", text)
+    assert get_analysis_history(1)[0]["openai_response"] == text
+
+
+def test_round_trip_with_trained_dictionary(store, monkeypatch):
+    for i in range(20):
+        _insert(store, f"prompt {i}", f"Comuna {i}\n{RESPONSE}")
+    plain = storage.encode_text(f"Comuna nueva\n{RESPONSE}")
+
+    result = storage.train_dictionary(sample_size=20)
+    assert result["trained"] and result["samples"] == 20
+
+    with_dict = storage.encode_text(f"Comuna nueva\n{RESPONSE}")
+    assert storage.HEADER.unpack_from(with_dict, len(storage.MAGIC)) == (result["dict_id"],)
+    assert len(with_dict) < len(plain)
+
+    # Otro proceso (caché vacío) carga el diccionario desde la base al leer
+    monkeypatch.setattr(storage, "_dicts", {})
+    assert storage.decode_text(with_dict) == f"Comuna nueva\n{RESPONSE}"
+    assert storage.decode_text(plain) == f"Comuna nueva\n{RESPONSE}"
+
+
+def test_archived_rows_are_still_found(store):
+    old = [_insert(store, f"prompt viejo {i}", RESPONSE * 3, days_ago=120, batch_id="lote-1") for i in range(5)]
+    recent = _insert(store, "prompt nuevo", RESPONSE, days_ago=1)
+
+    result = storage.archive_old_analyses(days=90)
+
+    assert result["archived_rows"] == 5
+    path = result["archive_file"]
+    assert os.path.exists(path) and not os.path.exists(path + ".tmp")
+    assert os.stat(path).st_mode & 0o222 == 0
+    with store.db_connection() as conn:
+        remaining = [r["id"] for r in conn.execute("SELECT id FROM accident_analysis")]
+    assert remaining == [recent]
+
+    row = get_analysis_by_id(old[2])
+    assert (row["user_prompt"], row["openai_response"]) == ("prompt viejo 2", RESPONSE * 3)
+    archive = sqlite3.connect(path)
+    try:
+        batch_ids = {r[0] for r in archive.execute("SELECT batch_id FROM accident_analysis")}
+    finally:
+        archive.close()
+    assert batch_ids == {"lote-1"}
+
+    assert storage.archive_old_analyses(days=90) == {"archived_rows": 0}
+
+
+def test_interrupted_archive_can_be_retried(store, monkeypatch):
+    ids = [_insert(store, f"prompt {i}", RESPONSE * 3, days_ago=120) for i in range(3)]
+
+    def crash(*args):
+        raise OSError("disco lleno")
+
+    with monkeypatch.context() as m:
+        m.setattr(storage.os, "replace", crash)
+        with pytest.raises(OSError):
+            storage.archive_old_analyses(days=90)
+
+    # Nada se borró ni se registró, y no quedan temporales
+    assert list(storage.ARCHIVE_DIR.iterdir()) == []
+    with store.db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM accident_analysis").fetchone()[0] == 3
+        assert conn.execute("SELECT COUNT(*) FROM analysis_archives").fetchone()[0] == 0
+
+    # Un archivo final huérfano (caída tras renombrar) se reemplaza al reintentar
+    orphan = storage.ARCHIVE_DIR / f"accident_analysis_{ids[0]}_{ids[-1]}.db"
+    orphan.write_bytes(b"basura")
+    result = storage.archive_old_analyses(days=90)
+
+    assert result["archived_rows"] == 3
+    assert get_analysis_by_id(ids[1])["user_prompt"] == "prompt 1"
+
+
+def test_concurrent_archive_calls_do_not_collide(store):
+    from concurrent.futures import ThreadPoolExecutor
+
+    for i in range(50):
+        _insert(store, f"prompt {i}", RESPONSE * 3, days_ago=120)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: storage.archive_old_analyses(days=90), range(4)))
+
+    assert sorted(r["archived_rows"] for r in results) == [0, 0, 0, 50]
+    with store.db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM analysis_archives").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM accident_analysis").fetchone()[0] == 0
+    assert [p.suffix for p in storage.ARCHIVE_DIR.iterdir()] == [".db"]
+
+
+def test_storage_endpoints(store):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    _insert(store, "prompt viejo", RESPONSE * 3, days_ago=120)
+    client = TestClient(app)
+
+    archived = client.post("/api/v1/storage/archive", params={"days": 90, "vacuum": True})
+    stats = client.get("/api/v1/storage/stats")
+
+    assert archived.status_code == 200 and archived.json()["archived_rows"] == 1
+    assert stats.status_code == 200 and len(stats.json()["archives"]) == 1